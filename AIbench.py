@@ -0,0 +1,498 @@
+"""
+AI IRC Bot - offline load test
+	Starts local stand-ins of IRC server and Anthropic/OpenAI APIs, runs AIbot.py against them and drives synthetic traffic (N channels x M users asking "nick: question")
+	Reports throughput, question-to-first-line latency, PING response time and memory (RSS) of the bot, no real API calls are made and no real IRC network is joined
+"""
+import os
+import sys
+import asyncio
+import argparse
+import configparser
+import tempfile
+import json
+import math
+import random
+import string
+import time
+
+VERSION = "20250203"
+BOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "AIbot.py")
+""" words of synthetic questions and answers """
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango", "uniform", "victor", "whiskey", "xray", "yankee", "zulu"]
+
+def printInfo(txt):
+	"""
+	PURPOSE:	Print the text with INFO header
+	VERIFIED:	YES
+	"""
+	print("INFO: " + txt, file=sys.stderr)
+
+def percentile(values, p):
+	"""
+	PURPOSE:	Return p-th percentile (0..100) of the values (nearest rank), None if there are no values
+	VERIFIED:	YES
+	"""
+	if (len(values) == 0):
+		return None
+	values = sorted(values)
+	return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+def ircLower(s):
+	"""
+	PURPOSE:	Return IRC lowercase of the string (ASCII only, enough for synthetic nicks and channels)
+	VERIFIED:	YES
+	"""
+	return s.lower()
+
+def getRss(pid):
+	"""
+	PURPOSE:	Return resident memory (bytes) of the process and its children (worker processes), None if not available (no /proc)
+	VERIFIED:	YES
+	"""
+	try:
+		with open("/proc/" + str(pid) + "/status") as f:
+			rss = 0
+			for line in f:
+				if line.startswith("VmRSS:"):
+					rss = int(line.split()[1]) * 1024
+		with open("/proc/" + str(pid) + "/task/" + str(pid) + "/children") as f:
+			for child in f.read().split():
+				rss += getRss(int(child)) or 0
+		return rss
+	except (OSError, ValueError):
+		return None
+
+async def readHttpRequest(reader):
+	"""
+	PURPOSE:	Return (METHOD, PATH, HEADERS, BODY) of the next HTTP/1.1 request on the connection, None if the connection is closed
+	VERIFIED:	YES
+	"""
+	try:
+		head = await reader.readuntil(b"\r\n\r\n")
+	except asyncio.IncompleteReadError:
+		return None
+	lines = head.decode("latin-1").split("\r\n")
+	method, path, _ = lines[0].split(" ", 2)
+	headers = {}
+	for line in lines[1:]:
+		if ":" in line:
+			k, v = line.split(":", 1)
+			headers[k.strip().lower()] = v.strip()
+	body = await reader.readexactly(int(headers.get("content-length", "0")))
+	return method, path, headers, body
+
+def httpResponse(status, reason, body, headers={}):
+	"""
+	PURPOSE:	Return complete HTTP/1.1 response (bytes) with JSON body (dict)
+	VERIFIED:	YES
+	"""
+	data = json.dumps(body).encode("UTF-8")
+	head = "HTTP/1.1 " + str(status) + " " + reason + "\r\ncontent-type: application/json\r\ncontent-length: " + str(len(data)) + "\r\n"
+	for k, v in headers.items():
+		head += k + ": " + v + "\r\n"
+	return (head + "\r\n").encode("latin-1") + data
+
+def httpChunk(data):
+	"""
+	PURPOSE:	Return data (str) as a chunk of chunked HTTP/1.1 response (empty data ends the response)
+	VERIFIED:	YES
+	"""
+	data = data.encode("UTF-8")
+	return format(len(data), "x").encode("latin-1") + b"\r\n" + data + b"\r\n"
+
+class FakeApi:
+	"""
+	PURPOSE:	Stand-in of Anthropic Messages API (POST /v1/messages) and OpenAI Chat Completions API (POST /v1/chat/completions), with and without streaming (SSE)
+							Latency of the first output is log-normal (median latency, sigma), streamed answers arrive in chunks of 3 words every chunk_delay seconds
+							Fraction (error_rate) of requests is answered with 429 (rate limit) and retry-after header
+	VERIFIED:	YES
+	"""
+	def __init__(self, latency, sigma, chunk_delay, words, error_rate, retry_after):
+		self.latency = latency
+		self.sigma = sigma
+		self.chunk_delay = chunk_delay
+		self.words = words
+		self.error_rate = error_rate
+		self.retry_after = retry_after
+		self.requests = { "anthropic": 0, "openai": 0 }
+		self.rate_limited = 0
+		self.streams = 0
+
+	def delay(self):
+		"""
+		PURPOSE:	Return random latency (seconds) of the first output
+		"""
+		if (self.sigma <= 0) or (self.latency <= 0):
+			return self.latency
+		return random.lognormvariate(math.log(self.latency), self.sigma)
+
+	async def handle(self, reader, writer):
+		"""
+		PURPOSE:	Answer requests of one (keep-alive) connection
+		"""
+		try:
+			while True:
+				request = await readHttpRequest(reader)
+				if request is None:
+					break
+				method, path, headers, body = request
+				await self.respond(writer, path.split("?")[0], json.loads(body) if (len(body) > 0) else {})
+		except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+			pass
+		except asyncio.CancelledError:
+			""" test is over, request of the bot is left unanswered """
+		finally:
+			writer.close()
+
+	async def respond(self, writer, path, request):
+		"""
+		PURPOSE:	Answer one request
+		"""
+		if path.endswith("/messages"):
+			api = "anthropic"
+		elif path.endswith("/chat/completions"):
+			api = "openai"
+		else:
+			writer.write(httpResponse(404, "Not Found", { "error": { "type": "not_found_error", "message": path } }))
+			return
+		self.requests[api] += 1
+		if (random.random() < self.error_rate):
+			self.rate_limited += 1
+			error = { "type": "rate_limit_error", "message": "Rate limit exceeded (AIbench)" }
+			writer.write(httpResponse(429, "Too Many Requests", { "type": "error", "error": error } if (api == "anthropic") else { "error": error }, { "retry-after": str(self.retry_after) }))
+			await writer.drain()
+			return
+		await asyncio.sleep(self.delay())
+		text = " ".join(random.choice(WORDS) for i in range(self.words))
+		chunks = [" ".join(text.split(" ")[i:i + 3]) + " " for i in range(0, self.words, 3)]
+		tokens_in = len(json.dumps(request.get("messages", []))) // 4 + len(str(request.get("system", ""))) // 4
+		tokens_out = self.words
+		model = request.get("model", "")
+		if not request.get("stream"):
+			await asyncio.sleep(self.chunk_delay * (len(chunks) - 1))
+			if (api == "anthropic"):
+				body = { "id": "msg_bench", "type": "message", "role": "assistant", "model": model, "content": [{ "type": "text", "text": text }], "stop_reason": "end_turn", "stop_sequence": None, "usage": { "input_tokens": tokens_in, "output_tokens": tokens_out } }
+			else:
+				body = { "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": model, "choices": [{ "index": 0, "message": { "role": "assistant", "content": text }, "finish_reason": "stop" }], "usage": { "prompt_tokens": tokens_in, "completion_tokens": tokens_out, "total_tokens": tokens_in + tokens_out } }
+			writer.write(httpResponse(200, "OK", body))
+			await writer.drain()
+			return
+		self.streams += 1
+		writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\ntransfer-encoding: chunked\r\n\r\n")
+		if (api == "anthropic"):
+			events = [["message_start", { "type": "message_start", "message": { "id": "msg_bench", "type": "message", "role": "assistant", "model": model, "content": [], "stop_reason": None, "stop_sequence": None, "usage": { "input_tokens": tokens_in, "output_tokens": 1 } } }],
+				["content_block_start", { "type": "content_block_start", "index": 0, "content_block": { "type": "text", "text": "" } }]]
+			events += [["content_block_delta", { "type": "content_block_delta", "index": 0, "delta": { "type": "text_delta", "text": chunk } }] for chunk in chunks]
+			events += [["content_block_stop", { "type": "content_block_stop", "index": 0 }],
+				["message_delta", { "type": "message_delta", "delta": { "stop_reason": "end_turn", "stop_sequence": None }, "usage": { "output_tokens": tokens_out } }],
+				["message_stop", { "type": "message_stop" }]]
+			events = ["event: " + e[0] + "\ndata: " + json.dumps(e[1]) + "\n\n" for e in events]
+		else:
+			chunk = { "id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model }
+			events = [dict(chunk, choices=[{ "index": 0, "delta": { "content": c }, "finish_reason": None }]) for c in chunks]
+			events.append(dict(chunk, choices=[{ "index": 0, "delta": {}, "finish_reason": "stop" }]))
+			if (request.get("stream_options") or {}).get("include_usage"):
+				events.append(dict(chunk, choices=[], usage={ "prompt_tokens": tokens_in, "completion_tokens": tokens_out, "total_tokens": tokens_in + tokens_out }))
+			events = ["data: " + json.dumps(e) + "\n\n" for e in events] + ["data: [DONE]\n\n"]
+		for i, event in enumerate(events):
+			if (i > 0) and (self.chunk_delay > 0):
+				await asyncio.sleep(self.chunk_delay)
+			writer.write(httpChunk(event))
+			await writer.drain()
+		writer.write(httpChunk(""))
+		await writer.drain()
+
+class FakeIrc:
+	"""
+	PURPOSE:	Stand-in of IRC server for the bot: registers it, confirms JOINs and answers PINGs
+							Synthetic users (users per channel) ask the bot questions one at a time (next question after the answer, or timeout, and think time)
+							Latency is measured from the question to the first line of the answer, PING response time from PING to PONG
+	VERIFIED:	YES
+	"""
+	def __init__(self, channels, users, think, timeout, ping_interval):
+		self.channels = channels
+		self.users = users
+		self.think = think
+		self.timeout = timeout
+		self.ping_interval = ping_interval
+		self.writer = None
+		self.nickname = ""
+		self.registered = asyncio.Event()
+		self.joined = set()
+		self.all_joined = asyncio.Event()
+		""" (CHANNEL, NICK) -> [TIME ASKED, EVENT set on the first line of the answer] """
+		self.pending = {}
+		self.asked = 0
+		self.answered = 0
+		self.timeouts = 0
+		self.lines = 0
+		self.latencies = []
+		""" PING token -> time sent """
+		self.pings = {}
+		self.ping_times = []
+		self.running = False
+
+	def send(self, line):
+		"""
+		PURPOSE:	Send the line to the bot
+		"""
+		if self.writer is not None:
+			self.writer.write((line + "\r\n").encode("UTF-8"))
+
+	async def handle(self, reader, writer):
+		"""
+		PURPOSE:	Serve the connection of the bot (only one at a time is expected)
+		"""
+		self.writer = writer
+		user = False
+		try:
+			while True:
+				data = await reader.readline()
+				if (len(data) == 0):
+					break
+				chunk = data.decode("UTF-8", errors="replace").rstrip("\r\n").split(" ", 2)
+				match (chunk[0].upper()):
+					case "USER":
+						user = True
+					case "NICK":
+						if not self.registered.is_set():
+							self.nickname = chunk[1].lstrip(":")
+							if (user):
+								self.send(":bench.local 001 " + self.nickname + " :Welcome to AIbench")
+								self.registered.set()
+					case "JOIN":
+						for channel in chunk[1].lstrip(":").split(","):
+							self.send(":" + self.nickname + "!bench@bench.local JOIN :" + channel)
+							self.joined.add(ircLower(channel))
+						if (len(self.joined) >= self.channels):
+							self.all_joined.set()
+					case "PING":
+						self.send(":bench.local PONG bench.local :" + chunk[1].lstrip(":"))
+					case "PONG":
+						token = data.decode("UTF-8", errors="replace").rstrip("\r\n").split(":")[-1]
+						sent = self.pings.pop(token, None)
+						if sent is not None:
+							self.ping_times.append(time.monotonic() - sent)
+					case "PRIVMSG":
+						self.lines += 1
+						if (len(chunk) == 3) and (":" in chunk[2][1:]):
+							element = self.pending.pop((ircLower(chunk[1]), ircLower(chunk[2][1:].split(":")[0])), None)
+							if element is not None:
+								self.latencies.append(time.monotonic() - element[0])
+								element[1].set()
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+	async def ping(self):
+		"""
+		PURPOSE:	Send PING every ping_interval seconds while running
+		"""
+		i = 0
+		while self.running:
+			token = "bench" + str(i)
+			i += 1
+			self.pings[token] = time.monotonic()
+			self.send("PING :" + token)
+			await asyncio.sleep(self.ping_interval)
+
+	async def user(self, channel, nick, start):
+		"""
+		PURPOSE:	Ask questions as the user (nick) on the channel until stopped
+		"""
+		await asyncio.sleep(start)
+		i = 0
+		while self.running:
+			question = "question " + str(i) + " from " + nick + ": " + " ".join(random.choice(WORDS) for k in range(8)) + "?"
+			i += 1
+			answered = asyncio.Event()
+			self.pending[(ircLower(channel), ircLower(nick))] = [time.monotonic(), answered]
+			self.asked += 1
+			self.send(":" + nick + "!u@bench.local PRIVMSG " + channel + " :" + self.nickname + ": " + question)
+			try:
+				await asyncio.wait_for(answered.wait(), self.timeout)
+				self.answered += 1
+			except asyncio.TimeoutError:
+				self.pending.pop((ircLower(channel), ircLower(nick)), None)
+				self.timeouts += 1
+			if (self.think > 0):
+				await asyncio.sleep(random.expovariate(1 / self.think))
+
+	async def run(self, duration, ramp):
+		"""
+		PURPOSE:	Drive the traffic for duration seconds (users start spread over ramp seconds), return the time it ran
+		"""
+		self.running = True
+		tasks = [asyncio.create_task(self.ping())]
+		for c in range(self.channels):
+			for u in range(self.users):
+				tasks.append(asyncio.create_task(self.user("#bench" + str(c), "user" + str(c) + "x" + str(u), random.uniform(0, ramp))))
+		start = time.monotonic()
+		await asyncio.sleep(duration)
+		self.running = False
+		elapsed = time.monotonic() - start
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		return elapsed
+
+def createConfig(args, irc_port, api_port, directory):
+	"""
+	PURPOSE:	Write configuration file of the bot pointing it to the stand-ins, return its path
+							Options set with --set SECTION.OPTION=VALUE override the generated ones
+	VERIFIED:	YES
+	"""
+	config = configparser.ConfigParser(interpolation=None)
+	config.optionxform = str
+	config["AI"] = {
+		"model": args.model,
+		"api_key": "bench-" + "".join(random.choices(string.ascii_lowercase, k=8)),
+		"anthropic_base_url": "http://127.0.0.1:" + str(api_port),
+		"openai_base_url": "http://127.0.0.1:" + str(api_port) + "/v1",
+		"stream": str(args.stream).lower(),
+		"max_queue": str(max(32, args.channels * args.users)),
+	}
+	config["IRC"] = {
+		"log_file": os.path.join(directory, "AIbot.jsonl"),
+		"server[0].name": "127.0.0.1",
+		"server[0].port": str(irc_port),
+		"server[0].ident": "bench",
+		"server[0].nickname": "BenchBot",
+		"server[0].flood_rate": "0",
+	}
+	for c in range(args.channels):
+		config["IRC"]["channel[" + str(c) + "].name"] = "#bench" + str(c)
+	for option in args.set:
+		name, value = option.split("=", 1)
+		section, name = name.split(".", 1)
+		if not config.has_section(section):
+			config.add_section(section)
+		config[section][name] = value
+	path = os.path.join(directory, "AIbench.conf")
+	with open(path, "w") as f:
+		config.write(f)
+	return path
+
+def report(args, irc, api, elapsed, rss):
+	"""
+	PURPOSE:	Return results (dict) of the run
+	VERIFIED:	YES
+	"""
+	result = {
+		"version": VERSION,
+		"model": args.model,
+		"stream": args.stream,
+		"channels": args.channels,
+		"users": args.users,
+		"duration": round(elapsed, 3),
+		"asked": irc.asked,
+		"answered": irc.answered,
+		"timeouts": irc.timeouts,
+		"unanswered": len(irc.pending),
+		"throughput": round(irc.answered / elapsed, 3) if (elapsed > 0) else 0,
+		"lines": irc.lines,
+		"api_requests": api.requests,
+		"api_rate_limited": api.rate_limited,
+		"api_streams": api.streams,
+		"rss_peak": max(rss) if (len(rss) > 0) else None,
+		"rss_last": rss[-1] if (len(rss) > 0) else None,
+	}
+	for name, values in [["latency", irc.latencies], ["ping", irc.ping_times]]:
+		for p in [50, 95, 99]:
+			v = percentile(values, p)
+			result[name + "_p" + str(p)] = round(v, 4) if v is not None else None
+		result[name + "_max"] = round(max(values), 4) if (len(values) > 0) else None
+		result[name + "_samples"] = len(values)
+	return result
+
+def printReport(result):
+	"""
+	PURPOSE:	Print results of the run in human readable form
+	VERIFIED:	YES
+	"""
+	def ms(v):
+		return (str(round(v * 1000, 1)) + " ms") if v is not None else "n/a"
+	def mib(v):
+		return (str(round(v / 1048576, 1)) + " MiB") if v is not None else "n/a"
+	print("Model:              " + result["model"] + (" (stream)" if result["stream"] else ""))
+	print("Channels x users:   " + str(result["channels"]) + " x " + str(result["users"]))
+	print("Duration:           " + str(result["duration"]) + " s")
+	print("Questions:          asked " + str(result["asked"]) + ", answered " + str(result["answered"]) + ", timed out " + str(result["timeouts"]) + ", unanswered " + str(result["unanswered"]))
+	print("Throughput:         " + str(result["throughput"]) + " answers/s (" + str(result["lines"]) + " lines)")
+	for name, title in [["latency", "First line latency: "], ["ping", "PING response:      "]]:
+		print(title + "p50 " + ms(result[name + "_p50"]) + ", p95 " + ms(result[name + "_p95"]) + ", p99 " + ms(result[name + "_p99"]) + ", max " + ms(result[name + "_max"]) + " (" + str(result[name + "_samples"]) + " samples)")
+	print("RSS:                peak " + mib(result["rss_peak"]) + ", last " + mib(result["rss_last"]))
+	print("API:                anthropic " + str(result["api_requests"]["anthropic"]) + ", openai " + str(result["api_requests"]["openai"]) + " requests, " + str(result["api_rate_limited"]) + " rate limited (429), " + str(result["api_streams"]) + " streamed")
+
+async def bench(args):
+	"""
+	PURPOSE:	Start the stand-ins and the bot, drive the traffic and return the results (dict)
+	VERIFIED:	YES
+	"""
+	irc = FakeIrc(args.channels, args.users, args.think, args.timeout, args.ping_interval)
+	api = FakeApi(args.latency, args.sigma, args.chunk_delay, args.words, args.error_rate, args.retry_after)
+	irc_server = await asyncio.start_server(irc.handle, "127.0.0.1", 0)
+	api_server = await asyncio.start_server(api.handle, "127.0.0.1", 0, limit=1048576)
+	with tempfile.TemporaryDirectory(prefix="AIbench") as directory:
+		conf = createConfig(args, irc_server.sockets[0].getsockname()[1], api_server.sockets[0].getsockname()[1], directory)
+		output = open(args.bot_output, "w") if (args.bot_output) else asyncio.subprocess.DEVNULL
+		bot = await asyncio.create_subprocess_exec(sys.executable, BOT, conf, stdin=asyncio.subprocess.DEVNULL, stdout=output, stderr=asyncio.subprocess.STDOUT, cwd=directory)
+		try:
+			printInfo("Waiting for the bot to join " + str(args.channels) + " channels...")
+			await asyncio.wait_for(irc.all_joined.wait(), args.startup)
+			printInfo("Running " + str(args.channels) + " x " + str(args.users) + " users for " + str(args.duration) + " seconds...")
+			rss = []
+			async def sample():
+				while True:
+					v = getRss(bot.pid)
+					if v is not None:
+						rss.append(v)
+					await asyncio.sleep(0.5)
+			sampler = asyncio.create_task(sample())
+			elapsed = await irc.run(args.duration, args.ramp)
+			sampler.cancel()
+			return report(args, irc, api, elapsed, rss)
+		finally:
+			if (bot.returncode is None):
+				bot.terminate()
+				await bot.wait()
+			if (args.bot_output):
+				output.close()
+			irc_server.close()
+			api_server.close()
+
+def main():
+	"""
+	PURPOSE:	Parse command line and run the load test
+	VERIFIED:	YES
+	"""
+	parser = argparse.ArgumentParser(description="Offline load test of AI IRC Bot (local fake IRC server and Anthropic/OpenAI APIs).")
+	parser.add_argument("--channels", type=int, default=4, help="number of channels (default: 4)")
+	parser.add_argument("--users", type=int, default=5, help="number of users asking questions on every channel (default: 5)")
+	parser.add_argument("--duration", type=float, default=30, help="duration of the test in seconds (default: 30)")
+	parser.add_argument("--ramp", type=float, default=1, help="users start spread over this many seconds (default: 1)")
+	parser.add_argument("--think", type=float, default=1, help="mean time in seconds between the answer and the next question of the user (default: 1)")
+	parser.add_argument("--timeout", type=float, default=60, help="time in seconds the user waits for the answer (default: 60)")
+	parser.add_argument("--model", default="gpt-4o-mini", help="model of the bot, its vendor's API is used (default: gpt-4o-mini)")
+	parser.add_argument("--stream", action="store_true", help="stream answers (stream = true)")
+	parser.add_argument("--latency", type=float, default=0.5, help="median latency in seconds of the first output of the API (default: 0.5)")
+	parser.add_argument("--sigma", type=float, default=0.5, help="sigma of log-normal latency distribution, 0 = constant latency (default: 0.5)")
+	parser.add_argument("--chunk-delay", type=float, default=0.02, help="time in seconds between streamed chunks (3 words) of the answer (default: 0.02)")
+	parser.add_argument("--words", type=int, default=60, help="number of words of the answer (default: 60)")
+	parser.add_argument("--error-rate", type=float, default=0, help="fraction of API requests answered with 429 (default: 0)")
+	parser.add_argument("--retry-after", type=int, default=1, help="retry-after of 429 answers in seconds (default: 1)")
+	parser.add_argument("--ping-interval", type=float, default=0.5, help="time in seconds between PINGs sent to the bot (default: 0.5)")
+	parser.add_argument("--startup", type=float, default=30, help="time in seconds the bot has to connect and join channels (default: 30)")
+	parser.add_argument("--set", action="append", default=[], metavar="SECTION.OPTION=VALUE", help="set option of the bot's configuration, e.g. AI.workers=2 (repeatable)")
+	parser.add_argument("--bot-output", default="", metavar="FILE", help="write console output of the bot to the file")
+	parser.add_argument("--json", action="store_true", help="print results as JSON")
+	args = parser.parse_args()
+	result = asyncio.run(bench(args))
+	if (args.json):
+		print(json.dumps(result))
+	else:
+		printReport(result)
+
+if __name__ == "__main__":
+	main()
@@ -1,43 +1,47 @@
+import time
+""" start of the program (--startup-profile) """
+START_TIME = time.perf_counter()
 import os
 import sys
 import socket
 import ssl
+import asyncio
 import configparser
-import time
+import collections
+import bisect
+import fnmatch
+import heapq
+import hashlib
+import importlib.util
+import sqlite3
 import datetime
-import pytz
+import email.utils
+import json
+import gzip
+import shutil
+import zlib
 from typing import Union, Tuple
 import random
+import unicodedata
 import string
-import pyshorteners
 """
-AI API(s)
+AI API(s) (openai, anthropic) and URL shortener (pyshorteners) are imported on first use
 """
-import openai
-import anthropic
 
 VERSION = "20250203"
 AUTHOR = "Mariusz J. Handke"
 AUTHOR_NICK = "oiram"
 GH = "https://github.com/oiramNet/AI-IRC-Bot"
 
-PROG = sys.argv[0]
-LOG = PROG + ".log"
-if len(sys.argv)>1:
-	CONF_FILE = sys.argv[1]
-else:
-	CONF_FILE = ""
-
-print("")
-print("+----------------------------------------+")
-print("|               AI IRC Bot               |")
-print("|                " + VERSION + "                |")
-print("|          by " + AUTHOR + "          |")
-print("|      " + AUTHOR_NICK + "@IRCnet   " + AUTHOR_NICK + "@IRCnet2      |")
-print("|                                        |")
-print("| " + GH + " |")
-print("+----------------------------------------+")
-print("")
+""" name of the program (AIbot.py), log file and configuration file, set from the command line by main() """
+PROG = __file__
+LOG = PROG + ".jsonl"
+CONF_FILE = ""
+""" worker process started by the supervisor (PROG CONF_FILE --worker ID), its stdout (ipc) is reserved for messages to the supervisor and console output goes to stderr """
+WORKER = -1
+ipc = None
+""" report startup time of the phases (--startup-profile) """
+STARTUP_PROFILE = False
 
 #
 # DEFINITIONS
@@ -45,24 +49,97 @@ print("")
 
 """
 Lists of supported AI models
-	ELEMENT:	API(VENDOR), NAME, TYPE(CHAT or IMAGE), MODELS
+	ELEMENT:	API(VENDOR), NAME, TYPE(CHAT or IMAGE), MODELS, CONTEXT(context window in tokens)
 """
 MODEL = [
-["Anthropic",	"Claude",		"CHAT",		"claude-3-5-sonnet-latest"],
-["Anthropic",	"Claude",		"CHAT",		"claude-3-5-haiku-latest"],
-["OpenAI",		"ChatGPT",	"CHAT",		"o3-mini"],	# 20250203
-["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4o"],
-["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4o-mini"],
-["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4"],
-["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4-turbo"],
-["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4-turbo-preview"],
-["OpenAI",		"ChatGPT",	"CHAT",		"gpt-3.5-turbo"],
-["OpenAI",		"DALL",			"IMAGE",	"dall-e-2"],
-["OpenAI",		"DALL",			"IMAGE",	"dall-e-3"],
+["Anthropic",	"Claude",		"CHAT",		"claude-3-5-sonnet-latest",	200000],
+["Anthropic",	"Claude",		"CHAT",		"claude-3-5-haiku-latest",	200000],
+["OpenAI",		"ChatGPT",	"CHAT",		"o3-mini",	200000],	# 20250203
+["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4o",	128000],
+["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4o-mini",	128000],
+["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4",	8192],
+["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4-turbo",	128000],
+["OpenAI",		"ChatGPT",	"CHAT",		"gpt-4-turbo-preview",	128000],
+["OpenAI",		"ChatGPT",	"CHAT",		"gpt-3.5-turbo",	16385],
+["OpenAI",		"DALL",			"IMAGE",	"dall-e-2",	0],
+["OpenAI",		"DALL",			"IMAGE",	"dall-e-3",	0],
 ]
 
 # other global settings
 reconnect = 5
+ping_interval = 120
+fallback_encoding = "latin-1"
+max_line_buffer = 16384
+""" reconnect to IRC network: delay (seconds) grows exponentially with jitter from RECONNECT_MIN up to RECONNECT_MAX, and is reset once registered """
+RECONNECT_MIN = 1
+RECONNECT_MAX = 60
+""" time (seconds) to wait for the connection before the next server (address) is tried in parallel, connection and registration timeouts """
+CONNECT_STAGGER = 0.25
+CONNECT_TIMEOUT = 10
+REGISTER_TIMEOUT = 30
+""" time (seconds) resolved addresses of the servers are cached """
+DNS_CACHE_TTL = 600
+""" longest message (bytes) passed between the supervisor and worker processes """
+max_ipc_buffer = 1048576
+""" approximate size (bytes) of QAPair record without question and answer strings """
+QAPAIR_SIZE = 200
+""" version of the history file (PRAGMA user_version), older files are migrated once when opened, time (seconds) to wait for other process migrating the file and for locks afterwards """
+HISTORY_VERSION = 1
+HISTORY_MIGRATE_TIMEOUT = 300
+HISTORY_LOCK_TIMEOUT = 5
+""" approximate memory overhead (bytes) of the cached answer, on top of the question and answer text """
+CACHE_ENTRY_SIZE = 200
+""" backoff of retried AI requests (seconds), the delay grows exponentially from RETRY_BASE_DELAY up to RETRY_MAX_DELAY """
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 30
+""" priority lanes of the outbound IRC queue (lower is sent first) """
+PRIORITY_PONG = 0
+PRIORITY_NORMAL = 1
+PRIORITY_PRIVMSG = 2
+PRIORITY_LANES = 3
+""" maximum length (bytes) of IRC message without CR-LF, separator of merged short lines, placeholder for our host until it is known """
+IRC_LINE_MAX = 510
+LINE_SEPARATOR = " | "
+HOST_MAX = "x" * 63
+""" RFC1459 casemapping of channel and nick names: A-Z and []\\~ are upper case of a-z and {}|^ """
+IRC_CASEMAP = str.maketrans(string.ascii_uppercase + "[]\\~", string.ascii_lowercase + "{}|^")
+""" escaped characters in values of IRCv3 message tags (character after backslash -> character) """
+IRC_TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+""" maximum length of the running summary of older Q/A pairs (words, tokens) """
+SUMMARY_WORDS = 200
+SUMMARY_MAX_TOKENS = 400
+""" approximate number of tokens used by the message structure (role, separators) """
+MESSAGE_TOKENS = 4
+""" time (seconds) to wait for metrics of the worker processes """
+METRICS_TIMEOUT = 2
+""" time (seconds) on top of request_timeout to wait for the answer of the worker process (sending the answer to IRC, shortening URL) """
+WORKER_TIMEOUT = 60
+""" upper bounds (seconds) of buckets of latency histograms """
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+""" metrics (NAME -> [TYPE, LABELS, HELP]) exposed in Prometheus text format, histograms use LATENCY_BUCKETS """
+METRICS = {
+	"aibot_dispatch_seconds": ["histogram", ("network", "channel", "model"), "Time from receiving the question from IRC to starting to answer it (waiting in the queue of the scheduler)."],
+	"aibot_prompt_build_seconds": ["histogram", ("network", "channel", "model"), "Time to build the request to the model (profile, history)."],
+	"aibot_first_token_seconds": ["histogram", ("network", "channel", "model"), "Time from sending the request to the first token of the answer (the whole answer if not streamed)."],
+	"aibot_model_seconds": ["histogram", ("network", "channel", "model"), "Time of successful requests to the model."],
+	"aibot_send_seconds": ["histogram", ("network",), "Time from queueing the line to IRC to writing it to the server (flood control)."],
+	"aibot_questions_total": ["counter", ("network", "channel"), "Questions received."],
+	"aibot_tokens_in_total": ["counter", ("network", "channel", "model"), "Input (prompt) tokens used."],
+	"aibot_tokens_out_total": ["counter", ("network", "channel", "model"), "Output (completion) tokens used."],
+	"aibot_errors_total": ["counter", ("network", "channel", "model", "type"), "Failed requests to the model, by type of the error."],
+	"aibot_reconnects_total": ["counter", ("network",), "Reconnections to IRC network (connection lost or connection attempt failed)."],
+	"aibot_sent_bytes_total": ["counter", ("network",), "Bytes sent to IRC."],
+	"aibot_uptime_seconds": ["gauge", (), "Time since the start of the bot."],
+	"aibot_running_questions": ["gauge", (), "Questions being answered."],
+	"aibot_queued_questions": ["gauge", (), "Questions waiting in the queue of the scheduler."],
+	"aibot_inflight_questions": ["gauge", (), "Distinct questions being answered (the same question asked again waits for the same answer)."],
+	"aibot_irc_queue_lines": ["gauge", ("network",), "Lines waiting in the outbound IRC queue."],
+	"aibot_log_queue_records": ["gauge", (), "Records waiting to be written to the log file."],
+	"aibot_cache_entries": ["gauge", (), "Answers in the answer cache (of all processes)."],
+	"aibot_cache_bytes": ["gauge", (), "Approximate memory (bytes) used by the answer cache (of all processes)."],
+	"aibot_cache_hits": ["gauge", (), "Questions answered from the answer cache since the start."],
+	"aibot_cache_misses": ["gauge", (), "Questions not found in the answer cache since the start (asked the model)."],
+}
 
 def printDebug(debug, txt):
 	"""
@@ -86,6 +163,22 @@ def printInfo(txt):
 	"""
 	print("INFO: " + txt)
 
+def printBanner():
+	"""
+	PURPOSE:	Print the banner
+	VERIFIED:	YES
+	"""
+	print("")
+	print("+----------------------------------------+")
+	print("|               AI IRC Bot               |")
+	print("|                " + VERSION + "                |")
+	print("|          by " + AUTHOR + "          |")
+	print("|      " + AUTHOR_NICK + "@IRCnet   " + AUTHOR_NICK + "@IRCnet2      |")
+	print("|                                        |")
+	print("| " + GH + " |")
+	print("+----------------------------------------+")
+	print("")
+
 def srand(N):
 	"""
 	PURPOSE:	Return string of N random characters (uppercase letters and digits only)
@@ -98,7 +191,7 @@ def nowUTC():
 	PURPOSE:	Return current date/time in 24-hour format in UTC
 	VERIFIED:	YES
 	"""
-	return datetime.datetime.now(pytz.timezone('UTC'))
+	return datetime.datetime.now(datetime.timezone.utc)
 
 def todayIsUTC():
 	"""
@@ -130,12 +223,148 @@ def strtobool(val):	# not used
 		case _:
 			raise ValueError("Invalid logical value %r" % (val,))
 
-def getData(sock):
+def decodeLine(line):
 	"""
-	PURPOSE:	Return decoded (UTF-8) data (4096 bytes) pulled (read) from socket
-	VERIFIED:	TO DO
+	PURPOSE:	Return decoded (UTF-8) line, or decoded using fallback encoding if line is not valid UTF-8
+	VERIFIED:	YES
+	"""
+	try:
+		return line.decode("UTF-8")
+	except UnicodeDecodeError:
+		return line.decode(fallback_encoding, errors="replace")
+
+class IrcMessage:
+	"""
+	PURPOSE:	IRC message parsed by parseIrcMessage: IRCv3 tags (dict, unescaped values), prefix (nick!user@host or server name, without ":"), command and parameters (list, the trailing one without ":")
+	VERIFIED:	YES
+	"""
+	__slots__ = ("tags", "prefix", "command", "params")
+
+	def __init__(self, tags, prefix, command, params):
+		self.tags = tags
+		self.prefix = prefix
+		self.command = command
+		self.params = params
+
+def parseIrcTags(text):
+	"""
+	PURPOSE:	Return IRCv3 message tags (text: key[=value];...) as dict, escaped characters of the values (IRC_TAG_ESCAPES) are unescaped
+	VERIFIED:	YES
+	"""
+	tags = {}
+	for tag in text.split(";"):
+		key, _, value = tag.partition("=")
+		if ("\\" in value):
+			chars = []
+			i = 0
+			while (i < len(value)):
+				if (value[i] == "\\"):
+					""" unknown escape is the character itself, backslash at the end is dropped """
+					if (i + 1 < len(value)):
+						chars.append(IRC_TAG_ESCAPES.get(value[i + 1], value[i + 1]))
+					i += 2
+				else:
+					chars.append(value[i])
+					i += 1
+			value = "".join(chars)
+		if (len(key) > 0):
+			tags[key] = value
+	return tags
+
+def parseIrcMessage(line):
+	"""
+	PURPOSE:	Parse IRC message (line: [@TAGS] [:PREFIX] COMMAND [PARAMS] [:TRAILING]) in one pass, return IrcMessage or None if there is no command
+							Words are sliced out of the line at positions found by str.find, the line is not split and joined back
+	VERIFIED:	YES
+	"""
+	tags = {}
+	prefix = ""
+	pos = 0
+	if line.startswith("@"):
+		end = line.find(" ")
+		if (end < 0):
+			return None
+		tags = parseIrcTags(line[1:end])
+		pos = end + 1
+	while line.startswith(" ", pos):
+		pos += 1
+	if line.startswith(":", pos):
+		end = line.find(" ", pos)
+		if (end < 0):
+			return None
+		prefix = line[pos + 1:end]
+		pos = end + 1
+	words = []
+	length = len(line)
+	while (pos < length):
+		if (line[pos] == " "):
+			pos += 1
+			continue
+		if (line[pos] == ":") and (len(words) > 0):
+			words.append(line[pos + 1:])
+			break
+		end = line.find(" ", pos)
+		if (end < 0):
+			end = length
+		words.append(line[pos:end])
+		pos = end
+	if (len(words) == 0):
+		return None
+	return IrcMessage(tags, prefix, words[0], words[1:])
+
+def ircSkipMessage(net, line):
+	"""
+	PURPOSE:	Return True if the message (line) received from IRC network (net) can be skipped without parsing it
+							Skipped are messages with command without a handler (IRC_HANDLERS) and PRIVMSG not addressed to the bot on a channel (#CHANNEL :NICK: ...)
+							Only positions of the words are looked up (words are separated by single space, as sent by servers), nothing but the command and the nick is sliced out of the line
+	VERIFIED:	YES
+	"""
+	pos = 0
+	if line.startswith("@"):
+		pos = line.find(" ") + 1
+	if line.startswith(":", pos):
+		pos = line.find(" ", pos) + 1
+	end = line.find(" ", pos)
+	command = line[pos:end] if (end >= 0) else line[pos:]
+	if command not in IRC_HANDLERS:
+		return True
+	if (command != "PRIVMSG"):
+		return False
+	""" target must be a channel, the (trailing) text must start with NICK: followed by space (or end of the line) """
+	if not line.startswith("#", end + 1):
+		return True
+	pos = line.find(" ", end + 1) + 1
+	if (pos == 0):
+		return True
+	if line.startswith(":", pos):
+		pos += 1
+	end = pos + len(net.nick_key)
+	if not line.startswith(":", end) or not (line.startswith(" ", end + 1) or (end + 1 == len(line))):
+		return True
+	return (ircLower(line[pos:end]) != net.nick_key)
+
+async def getMessages(reader):
+	"""
+	PURPOSE:	Return generator of complete, decoded IRC messages (lines) pulled (read) from stream, raise ConnectionError when stream is closed
+							Data is read in 4096 bytes blocks into a buffer and split on LF (CRLF), incomplete line is kept in the buffer until the rest arrives
+	VERIFIED:	YES
 	"""
-	return sock.recv(4096).decode("UTF-8")
+	buffer = bytearray()
+	while True:
+		data = await reader.read(4096)
+		if (len(data) == 0):
+			raise ConnectionError("Connection closed by the server")
+		buffer += data
+		start = 0
+		end = buffer.find(b"\n")
+		while (end >= 0):
+			yield decodeLine(bytes(buffer[start:end])).rstrip("\r")
+			start = end + 1
+			end = buffer.find(b"\n", start)
+		del buffer[:start]
+		if (len(buffer) > max_line_buffer):
+			""" no LF within the limit, drop the garbage instead of growing forever """
+			buffer.clear()
 
 def nextServer(id, idmax):
 	"""
@@ -147,23 +376,118 @@ def nextServer(id, idmax):
 	else:
 		return id + 1
 
-def netConnect(server, port, tls):
+class TlsContext(ssl.SSLContext):
 	"""
-	PURPOSE:	Return socket connected to the remote server on specified port, and use TLS if specified
+	PURPOSE:	SSL/TLS context which resumes the last TLS session of the server (tls_sessions) instead of doing a full handshake
+							asyncio does not pass a session to the TLS object it creates, so it is picked up here by the server's name (server_hostname)
+	VERIFIED:	YES
+	"""
+	def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+		if (session is None) and (server_hostname is not None):
+			session = tls_sessions.get(server_hostname.lower())
+		return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+def getTlsContext():
+	"""
+	PURPOSE:	Return SSL/TLS context shared by all connections (TLS sessions can be resumed only within the same context)
+	VERIFIED:	YES
+	"""
+	global tls_context
+	if tls_context is None:
+		tls_context = TlsContext(ssl.PROTOCOL_TLS_CLIENT)
+		tls_context.minimum_version = ssl.TLSVersion.TLSv1_2
+		tls_context.check_hostname = False
+		tls_context.verify_mode = ssl.CERT_NONE
+	return tls_context
+
+def saveTlsSession(server, writer):
+	"""
+	PURPOSE:	Remember TLS session of the connection to the server, so the next connection can resume it
+	VERIFIED:	YES
+	"""
+	ssl_object = writer.get_extra_info("ssl_object")
+	if ssl_object is None:
+		return
+	if ssl_object.session_reused:
+		printInfo("TLS session resumed (" + server + ")")
+	if ssl_object.session is not None:
+		tls_sessions[server.lower()] = ssl_object.session
+
+async def resolveHost(host, port):
+	"""
+	PURPOSE:	Return list of addresses of the host, results are cached for DNS_CACHE_TTL seconds (dns_cache)
+	VERIFIED:	YES
+	"""
+	key = (host.lower(), port)
+	element = dns_cache.get(key)
+	if (element is not None) and (element[0] > time.monotonic()):
+		return element[1]
+	infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+	addresses = list(dict.fromkeys(info[4][0] for info in infos))
+	dns_cache[key] = [time.monotonic() + DNS_CACHE_TTL, addresses]
+	return addresses
+
+def forgetHost(host, port):
+	"""
+	PURPOSE:	Remove cached addresses of the host, so they are resolved again on the next connection
+	VERIFIED:	YES
+	"""
+	dns_cache.pop((host.lower(), port), None)
+
+async def netConnect(server, address, port, tls):
+	"""
+	PURPOSE:	Return stream (reader, writer) connected to the address of the remote server on specified port, and use TLS if specified
+							Raise an exception (OSError, TimeoutError) if the connection cannot be established within CONNECT_TIMEOUT seconds
 	VERIFIED:	YES
 	"""
-	sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-	try:
-		sock.connect((server, port))
-	except:
-		""" add exception handling """
 	if (tls):
-		sslcontext = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-		sslcontext.minimum_version = ssl.TLSVersion.TLSv1_2
-		sslcontext.check_hostname = False
-		sslcontext.verify_mode = ssl.CERT_NONE
-		sock = sslcontext.wrap_socket(sock, server_hostname=server)
-	return sock
+		return await asyncio.wait_for(asyncio.open_connection(address, port, ssl=getTlsContext(), server_hostname=server), CONNECT_TIMEOUT)
+	return await asyncio.wait_for(asyncio.open_connection(address, port), CONNECT_TIMEOUT)
+
+def closeConnection(task):
+	"""
+	PURPOSE:	Cancel connection attempt (task of netConnect()), or close the connection if it has been already established
+	VERIFIED:	YES
+	"""
+	if not task.done():
+		task.cancel()
+	elif (not task.cancelled()) and (task.exception() is None):
+		task.result()[1].close()
+
+async def netConnectAny(servers, first):
+	"""
+	PURPOSE:	Return (SERVER element, reader, writer) of the first connection established to any of the servers, None if all of them failed
+							Servers are tried in order starting from index first, each address of the server is a separate attempt
+							Next attempt starts when the previous one fails or after CONNECT_STAGGER seconds without waiting for it, the first connection wins and the others are closed
+	VERIFIED:	YES
+	"""
+	attempts = []
+	for k in range(len(servers)):
+		srv = servers[(first + k) % len(servers)]
+		try:
+			for address in await resolveHost(srv[0], srv[1]):
+				attempts.append([srv, address])
+		except OSError as e:
+			printError("Unable to resolve " + srv[0] + ": " + str(e))
+	pending = {}
+	try:
+		while (len(attempts) > 0) or (len(pending) > 0):
+			if (len(attempts) > 0):
+				srv, address = attempts.pop(0)
+				printInfo("Connecting to " + str(srv[0]) + " (" + address + "):" + str(srv[1]) + " (TLS: " + str(srv[2]) + ")")
+				pending[asyncio.create_task(netConnect(srv[0], address, srv[1], srv[2]))] = [srv, address]
+			done, _ = await asyncio.wait(pending, timeout=CONNECT_STAGGER if len(attempts) > 0 else None, return_when=asyncio.FIRST_COMPLETED)
+			for task in done:
+				srv, address = pending.pop(task)
+				e = task.exception()
+				if e is None:
+					return srv, *task.result()
+				printError("Connection to " + srv[0] + " (" + address + ") failed: " + (str(e) or type(e).__name__))
+				forgetHost(srv[0], srv[1])
+		return None
+	finally:
+		for task in pending:
+			closeConnection(task)
 
 def ircAuth(irc, password, ident, realname, nickname):
 	"""
@@ -171,38 +495,9 @@ def ircAuth(irc, password, ident, realname, nickname):
 	VERIFIED:	YES
 	"""
 	if password:
-		irc.send(bytes("PASS " + password + "\n", "UTF-8"))
-	irc.send(bytes("USER " + ident + " 0 * :" + realname + "\n", "UTF-8"))
-	irc.send(bytes("NICK " + nickname + "\n", "UTF-8"))
-
-def ircSetNick(irc, nick, nickname):
-	"""
-	PURPOSE:	Set (change) the nickname
-							nick: nickname to set
-							nickname: previous nickname
-	VERIFIED:	YES
-	"""
-	irc.send(bytes("NICK " + nick + "\n", "UTF-8"))
-	ircmsg = getData(irc)
-	rcode = ircmsg.split()[1]
-	rnick = nickname
-	match (rcode):
-		case "432":
-			"""
-			ERR_ERRONEUSNICKNAME (RFC1459)
-			"""
-			printError("Erroneus nickname (" + nick + "). Using previous nickname instead (" + nickname + ")")
-		case "433":
-			"""
-			ERR_NICKNAMEINUSE (RFC1459)
-			"""
-			printError("My nickname (" + nick + ") is in use. Using previous nickname instead (" + nickname + ")")
-		case _:
-			"""
-			UNKNOWN RCODE, nick probably accepted
-			"""
-			rnick = nick
-	return rnick
+		irc.write(bytes("PASS " + password + "\n", "UTF-8"))
+	irc.write(bytes("USER " + ident + " 0 * :" + realname + "\n", "UTF-8"))
+	irc.write(bytes("NICK " + nickname + "\n", "UTF-8"))
 
 def ircJoinChannels(irc, channels):
 	"""
@@ -211,699 +506,2944 @@ def ircJoinChannels(irc, channels):
 	"""
 	irc.send(bytes("JOIN " + channels + "\n", "UTF-8"))
 
-def ircConnect(server, port, tls, password, ident, realname, wait):
+async def ircRegister(messages, irc, password, ident, realname, nick):
 	"""
-	PURPOSE:	Connect to IRC server using RANDOM nick
+	PURPOSE:	Register the connection with IRC server using the configured nick, return nickname or "" if registration failed
+							RANDOM nick (AIbot####) is used instead if the configured one is erroneous, in use or temporarily unavailable
 	VERIFIED:	YES
 	"""
-	time.sleep(wait)
-	""" generate 9 characters random nick (AIbot####) """
-	nickname = ("AIbot" + srand(4))[:9]
-	connected = True
-	printInfo("Connecting to " + str(server) + ":" + str(port) + " (TLS: " + str(tls) + ")")
-	try:
-		irc = netConnect(server, port, tls)
-		try:
-			ircAuth(irc, password, ident, realname, nickname)
-			try:
-				ircmsg = getData(irc)
-				rcode = ircmsg.split()[1]
-				if rcode == "020":
-					ircmsg = getData(irc)
-					rcode = ircmsg.split()[1]
-				match (rcode):
-					case "001":
-						printInfo("*** RPL_WELCOME (RFC2812) ***")
-					case "432":
-						printInfo("*** ERR_ERRONEUSNICKNAME (RFC1459) ***")
-						connected = False
-					case "433":
-						printInfo("*** ERR_NICKNAMEINUSE (RFC1459) ***")
-						connected = False
-					case "465":
-						printInfo("*** ERR_YOUREBANNEDCREEP (RFC1459) ***")
-						connected = False
-					case ":Closing":
-						printInfo("*** CLOSING ***")
-						connected = False
-					case _:
-						printInfo("ircConnect RCODE = " + str(rcode))
-			except:
-				printError("Connection to " + server + " failed - getData()")
-				connected = False
-		except:
-			printError("Connection to " + server + " failed - ircAuth()")
-			connected = False
-	except:
-		printError("Connection to " + server + " failed - netConnect()")
-		connected = False
-
-	if connected:
-		ircmsg = getData(irc)
-
-	return connected, irc, nickname
+	nickname = nick
+	ircAuth(irc, password, ident, realname, nickname)
+	while True:
+		msg = parseIrcMessage(await anext(messages))
+		if msg is None:
+			continue
+		match (msg.command):
+			case "PING":
+				""" answer PING cookies sent before registration is completed """
+				irc.write(bytes("PONG :" + (msg.params[0] if (len(msg.params) > 0) else "") + "\n", "UTF-8"))
+			case "ERROR":
+				printInfo("*** CLOSING ***")
+				return ""
+			case "001":
+				printInfo("*** RPL_WELCOME (RFC2812) ***")
+				return nickname
+			case "432" | "433" | "436" | "437":
+				"""
+				432: ERR_ERRONEUSNICKNAME (RFC1459)
+				433: ERR_NICKNAMEINUSE (RFC1459)
+				436: ERR_NICKCOLLISION (RFC1459)
+				437: ERR_UNAVAILRESOURCE (RFC2812)
+				"""
+				""" generate 9 characters random nick (AIbot####) """
+				rnick = ("AIbot" + srand(4))[:9]
+				printError("My nickname (" + nickname + ") is not available (" + msg.command + "). Using random nickname instead (" + rnick + ")")
+				nickname = rnick
+				irc.write(bytes("NICK " + nickname + "\n", "UTF-8"))
+			case "465":
+				printInfo("*** ERR_YOUREBANNEDCREEP (RFC1459) ***")
+				return ""
+			case _:
+				""" skip notices (020, NOTICE AUTH) """
 
 def ircConnectionDetails(irc, server, port, tls, password, ident, realname, nickname, channels):
 	"""
 	PURPOSE:	Display IRC connection details
 	VERIFIED:	YES
 	"""
-	try:
-		irc.getpeername()
+	if (irc.get_extra_info("peername") is not None):
 		printInfo("Connected to IRC")
 		print("\tSERVER: " + server)
 		print("\tNICK: " + nickname)
 		print("\tCHANNELS: ", channels)
-	except socket.error:
+	else:
 		printInfo("Not connected to IRC")
 
-def sendMessageToIrcChannel(irc, channel, reply_to, message):
+class IrcSender:
 	"""
-	PURPOSE:	Send message to IRC channel
+	PURPOSE:	Outbound IRC queue with priority lanes (PRIORITY_PONG first) and token bucket flood control
+							Up to burst lines are sent at once, then rate lines per second (rate <= 0 disables flood control)
+							Lines are written to the stream and drained (complete write) one by one by the run() task, time they waited and bytes sent are recorded in metrics of the network (name)
 	VERIFIED:	YES
 	"""
-	msgs = [x.strip() for x in (reply_to + ": " + message).split('\n')]
-	for msg in msgs:
-		while len(msg) > 0:
-			if len(msg) <= 392:
-				irc.send(bytes("PRIVMSG " + channel + " :" + msg + "\n", "UTF-8"))
-				msg = ""
-			else:
-				last_space_index = msg[:392].rfind(" ")
-				if last_space_index == -1:
-					last_space_index = 392
-				irc.send(bytes("PRIVMSG " + channel + " :" + msg[:last_space_index] + "\n", "UTF-8"))
-				msg = msg[last_space_index:].lstrip()
+	def __init__(self, name, writer, burst, rate):
+		""" label values (network) of metrics """
+		self.labels = (name,)
+		self.writer = writer
+		self.burst = max(1, burst)
+		self.rate = rate
+		self.tokens = self.burst
+		self.last = time.monotonic()
+		self.lanes = [collections.deque() for i in range(PRIORITY_LANES)]
+		self.ready = asyncio.Event()
+		self.task = None
 
-def getNickFromFull(full):	# 20241216
+	def send(self, data, priority=PRIORITY_NORMAL):
+		"""
+		PURPOSE:	Queue data (bytes, single IRC line) to be sent with given priority
+		"""
+		self.lanes[priority].append([data, time.monotonic()])
+		self.ready.set()
+
+	def pending(self):
+		"""
+		PURPOSE:	Return number of queued lines
+		"""
+		return sum(len(lane) for lane in self.lanes)
+
+	def start(self):
+		"""
+		PURPOSE:	Start sending queued lines in the background
+		"""
+		self.task = asyncio.create_task(self.run())
+
+	def close(self):
+		"""
+		PURPOSE:	Stop sending and close the stream, queued lines are dropped
+		"""
+		if self.task is not None:
+			self.task.cancel()
+		self.writer.close()
+
+	async def run(self):
+		"""
+		PURPOSE:	Send queued lines, the highest priority first, pacing them with token bucket
+		"""
+		try:
+			while True:
+				await self.ready.wait()
+				if (self.pending() == 0):
+					self.ready.clear()
+					continue
+				if (self.rate > 0):
+					now = time.monotonic()
+					self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+					self.last = now
+					if (self.tokens < 1):
+						await asyncio.sleep((1 - self.tokens) / self.rate)
+						continue
+					self.tokens -= 1
+				for lane in self.lanes:
+					if (len(lane) > 0):
+						data, queued = lane.popleft()
+						break
+				self.writer.write(data)
+				await self.writer.drain()
+				metrics.observe("aibot_send_seconds", self.labels, time.monotonic() - queued)
+				metrics.inc("aibot_sent_bytes_total", self.labels, len(data))
+		except (ConnectionError, OSError) as e:
+			printError("Unable to send data to IRC: " + str(e))
+			self.writer.close()
+
+class Scheduler:
 	"""
-	PURPOSE:	Return nick form full name
+	PURPOSE:	Queue of AI requests between IRC and the model with limits of concurrent requests (global, per channel, per nick)
+							Queued requests are started in round-robin order of channels, so one busy channel (or nick) does not starve the others
+							Queue is bounded (global and per nick), requests above the limit are dropped
 	VERIFIED:	YES
 	"""
-	try:
-		i = full.index("!")
-		return str(full.split("!")[0])
-	except:
-		return str("")
+	def __init__(self, max_requests, max_channel, max_nick, max_queue, max_nick_queue):
+		""" channels and nicks are keyed by (network, key of the name), the same names on different networks are different channels and users """
+		self.max_requests = max_requests
+		self.max_channel = max_channel
+		self.max_nick = max_nick
+		self.max_queue = max_queue
+		self.max_nick_queue = max_nick_queue
+		""" (network, channel) -> deque of queued requests [(network, nick), JOB] """
+		self.queues = {}
+		""" channels with queued requests, in round-robin order """
+		self.order = collections.deque()
+		self.running = 0
+		self.running_channel = collections.Counter()
+		self.running_nick = collections.Counter()
+		self.queued = 0
+		self.queued_nick = collections.Counter()
+		self.dropped = 0
+		self.tasks = set()
+
+	def submit(self, W, c, u, job):
+		"""
+		PURPOSE:	Submit request (job: function returning coroutine) of user (u: nick key) on the channel (c: channel key) of the network (W)
+							Return "started", "queued" or "dropped"
+		"""
+		c = (W, c)
+		u = (W, u)
+		""" queued requests are those not allowed yet (dispatch() starts them as soon as they are), so they do not hold back this one """
+		if self.allowed(c, u):
+			self.start(c, u, job)
+			return "started"
+		if (self.queued >= self.max_queue) or (self.queued_nick[u] >= self.max_nick_queue):
+			self.dropped += 1
+			return "dropped"
+		if c not in self.queues:
+			self.queues[c] = collections.deque()
+			self.order.append(c)
+		self.queues[c].append([u, job])
+		self.queued += 1
+		self.queued_nick[u] += 1
+		return "queued"
+
+	def allowed(self, c, u):
+		"""
+		PURPOSE:	Return True if request on the channel (c) from user (u) can be started now
+		"""
+		return (self.running < self.max_requests) and (self.running_channel[c] < self.max_channel) and (self.running_nick[u] < self.max_nick)
+
+	def start(self, c, u, job):
+		"""
+		PURPOSE:	Start request as a task
+		"""
+		self.running += 1
+		self.running_channel[c] += 1
+		self.running_nick[u] += 1
+		task = asyncio.create_task(job())
+		self.tasks.add(task)
+		task.add_done_callback(lambda task: self.done(task, c, u))
+
+	def done(self, task, c, u):
+		"""
+		PURPOSE:	Account for finished request and start queued ones
+		"""
+		self.tasks.discard(task)
+		self.running -= 1
+		self.running_channel[c] -= 1
+		if (self.running_channel[c] == 0):
+			del self.running_channel[c]
+		self.running_nick[u] -= 1
+		if (self.running_nick[u] == 0):
+			del self.running_nick[u]
+		self.dispatch()
+
+	def dispatch(self):
+		"""
+		PURPOSE:	Start queued requests, one per channel in round-robin order, while limits allow
+		"""
+		progress = True
+		while progress and (self.running < self.max_requests) and (len(self.order) > 0):
+			progress = False
+			for i in range(len(self.order)):
+				c = self.order[0]
+				self.order.rotate(-1)
+				queue = self.queues[c]
+				for request in queue:
+					if self.allowed(c, request[0]):
+						queue.remove(request)
+						self.queued -= 1
+						self.queued_nick[request[0]] -= 1
+						if (self.queued_nick[request[0]] == 0):
+							del self.queued_nick[request[0]]
+						self.start(c, request[0], request[1])
+						progress = True
+						break
+				if (len(queue) == 0):
+					del self.queues[c]
+					self.order.remove(c)
+				if (self.running >= self.max_requests):
+					break
 
-def getChannelIndex(channel, channels):
+class CircuitOpenError(Exception):
 	"""
-	PURPOSE:	Return index of the channel (string) within the channels (list), or -1 if not existing
+	PURPOSE:	Request was not sent, because circuit breaker of the vendor is open
 	VERIFIED:	YES
 	"""
-	i = -1
-	for c in channels:
-		if (c[0].lower() == channel.lower()):
-			i = channels.index(c)
-			break
-	return i
 
-def getChannelHistoryT(QA, C, U, T):
+class CircuitBreaker:
 	"""
-	PURPOSE:	Return list of Q/A pairs for the channel (C) from user (U) based on time (T)
-							T > 0:	within last T seconds
-							T = 0:	return no pairs
-							T < 0:	return all pairs
-	VERIFIED: YES
+	PURPOSE:	Stop sending requests to AI vendor which keeps failing
+							After max_failures consecutive failures the breaker opens and requests are rejected for cooldown seconds,
+							then a single request is let through to probe the vendor (success closes the breaker, failure keeps it open)
+	VERIFIED:	YES
 	"""
-	QA_chan = []
-	if (T < 0):
-		t0 = 0
-	elif (T == 0):
-		t0 = 2 * int(nowUTC().timestamp())	# 20241206
-	else:
-		t0 = int(nowUTC().timestamp()) - T	# 20241206
-	for element in QA:
-#		if (element[0].lower() == C.lower()) and (element[1] >= t0):
-		if ((element[0].lower() == C.lower()) and ((U == "") or (U == "*") or (element[2].lower() == U.lower())) and (element[1] >= t0)):
-			QA_chan.append(element)
-	return QA_chan
+	def __init__(self, name, max_failures, cooldown):
+		self.name = name
+		self.max_failures = max_failures
+		self.cooldown = cooldown
+		self.failures = 0
+		""" time (monotonic) the breaker was opened or probed, 0 if closed """
+		self.opened = 0
 
-def getChannelHistoryN(QA, C, U, N):
+	def allow(self):
+		"""
+		PURPOSE:	Return True if request can be sent to the vendor
+		"""
+		if (self.opened == 0):
+			return True
+		now = time.monotonic()
+		if (now - self.opened >= self.cooldown):
+			self.opened = now
+			return True
+		return False
+
+	def success(self):
+		"""
+		PURPOSE:	Account for successful request, close the breaker
+		"""
+		if (self.opened > 0):
+			printInfo("Circuit breaker of " + self.name + " closed.")
+		self.failures = 0
+		self.opened = 0
+
+	def failure(self):
+		"""
+		PURPOSE:	Account for failed request, open the breaker after max_failures consecutive failures
+		"""
+		self.failures += 1
+		if (self.max_failures > 0) and (self.failures >= self.max_failures):
+			if (self.opened == 0):
+				printError("Circuit breaker of " + self.name + " opened for " + str(self.cooldown) + " seconds after " + str(self.failures) + " failures.\n")
+			self.opened = time.monotonic()
+
+class Network:
 	"""
-	PURPOSE:	Return list of Q/A pairs for the channel (C) from user (U) based on number (N)
-							N > 0: return last N pairs
-							N = 0: return no pairs
-							N < 0: return all pairs
-	VERIFIED: YES
+	PURPOSE:	State of the connection to one IRC network: its servers (used for failover, in order), nickname, channels and outbound queue
+							The bot is connected to all networks at the same time, AI clients and caches are shared by all of them, history and limits are kept per network
+	VERIFIED:	YES
 	"""
-	QA_chan = []
-	for element in QA:
-		if ((element[0].lower() == C.lower()) and ((U == "") or (U == "*") or (element[2].lower() == U.lower()))):
-			QA_chan.append(element)
-	if (N < 0):
-		return QA_chan
-	elif (N == 0):
-		return []
-	else:
-		return QA_chan[-N:]
+	def __init__(self, name, servers):
+		self.name = name
+		self.servers = servers
+		self.server_id = len(servers) - 1
+		self.srv = servers[self.server_id]
+		""" outbound queue (IrcSender) once registered """
+		self.irc = None
+		self.nickname = ""
+		""" case-insensitive key of the nickname (ircLower) """
+		self.nick_key = ""
+		""" our prefix (nick!user@host) as seen by other users """
+		self.my_prefix = ""
+		self.last_rx = time.monotonic()
+		""" failed connection attempts in a row (reconnect backoff) """
+		self.failures = 0
+		""" channels (CHANNEL elements) of the network, permanent and invited """
+		self.channels = []
+		""" case-insensitive key of the channel name (ircLower) -> CHANNEL element """
+		self.channel_keys = {}
+		""" names of permanent channels (from config) """
+		self.joins = []
+
+	def addChannel(self, CHAN):
+		"""
+		PURPOSE:	Add the channel (CHANNEL element), its case-insensitive key (KEY) is computed once and appended to the element
+		"""
+		CHAN.append(ircLower(CHAN[0]))
+		self.channel_keys[CHAN[16]] = CHAN
+		self.channels.append(CHAN)
 
-def getChannelHistory(QA, C, U, T, N):
+def getNetwork(name, networks):
 	"""
-	PURPOSE:	Return list of Q/A pairs for the channel (C) from user (U) based on time (T) and number (N)
+	PURPOSE:	Return network (Network) of the name (case-insensitive), None if not found
 	VERIFIED:	YES
 	"""
-	QA_chan = getChannelHistoryT(QA, C, U, T)
-	QA_chan = getChannelHistoryN(QA_chan, C, U, N)
-	return QA_chan
+	for net in networks:
+		if (net.name.lower() == name.lower()):
+			return net
+	return None
 
-def leaveInChannelHistory(QA, C, U, T, N):
+def ircLineBudget(prefix, channel):
 	"""
-	PURPOSE:	Leave in history Q/A pairs for the channel (C) from user (U) based on time (T) and number (N)
+	PURPOSE:	Return number of bytes available for the text of PRIVMSG to the channel, as relayed by server with our prefix (nick!user@host)
 	VERIFIED:	YES
 	"""
-	QA_chan = getChannelHistory(QA, C, U, T, N)
-	delete = []
-	for element in QA:
-		if (element[0].lower() == C.lower()):
-			try:
-				i = QA_chan.index(element)
-			except:
-				delete.append(element)
+	return IRC_LINE_MAX - len((":" + prefix + " PRIVMSG " + channel + " :").encode("UTF-8"))
+
+def isGraphemeExtend(ch):
+	"""
+	PURPOSE:	Return True if the character (ch) is a part of the previous grapheme (combining mark, joiner, variation selector)
+	VERIFIED:	YES
+	"""
+	return (unicodedata.combining(ch) > 0) or (ch in "\u200c\u200d") or ("\ufe00" <= ch <= "\ufe0f")
+
+def splitIrcText(text, budget):
+	"""
+	PURPOSE:	Return list of parts of the text, each not longer than budget bytes (UTF-8)
+							Text is split on the last space within the budget, or on the last grapheme boundary if there is no space
+	VERIFIED:	YES
+	"""
+	parts = []
+	data = text.encode("UTF-8")
+	while (len(data) > budget):
+		""" do not cut UTF-8 sequence """
+		cut = budget
+		while (cut > 0) and ((data[cut] & 0xC0) == 0x80):
+			cut -= 1
+		space = data.rfind(b" ", 0, cut + 1)
+		if (space > 0):
+			cut = space
 		else:
-			""" """
-	for element in delete:
-		QA.remove(element)
+			""" do not separate combining marks and joined characters from their base character """
+			head = data[:cut].decode("UTF-8")
+			tail = data[cut:cut + 4].decode("UTF-8", errors="ignore")
+			while (len(head) > 1) and (((len(tail) > 0) and isGraphemeExtend(tail[0])) or (head[-1] == "\u200d")):
+				tail = head[-1]
+				head = head[:-1]
+			""" grapheme cluster longer than the budget (e.g. Zalgo text) can not be kept whole, cut it on the UTF-8 boundary """
+			if (len(head) > 1):
+				cut = len(head.encode("UTF-8"))
+		parts.append(data[:cut].decode("UTF-8").rstrip())
+		data = data[cut:].lstrip(b" ")
+	parts.append(data.decode("UTF-8"))
+	return parts
 
-def prepMessages(QA, C, U, T, N, Q):
+def packIrcLines(lines, budget, merge):
 	"""
-	PURPOSE:	Create list of AI-readable previous messages for the channel (C) from user (U) based on time (T) and number (N) and add current question (Q)
+	PURPOSE:	Return list of IRC lines (text of PRIVMSG) not longer than budget bytes
+							Empty lines are skipped, short lines are merged (separated with LINE_SEPARATOR) if merge is set
 	VERIFIED:	YES
 	"""
-	""" get previous Q/A pairs """
-	QA_chan = getChannelHistory(QA, C, U, T, N)
-	""" change into list of AI-readable messages (user/assistant pairs) """
-	messages = []
-	for element in QA_chan:
-		messages.append({"role": "user", "content": element[3]})
-		messages.append({"role": "assistant", "content": element[4]})
-	""" append current question """
-	messages.append({"role": "user", "content": Q})
-	return messages
+	packed = []
+	for line in lines:
+		line = line.strip()
+		if (len(line) == 0):
+			continue
+		if (merge) and (len(packed) > 0) and (len((packed[-1] + LINE_SEPARATOR + line).encode("UTF-8")) <= budget):
+			packed[-1] += LINE_SEPARATOR + line
+		else:
+			packed += splitIrcText(line, budget)
+	return packed
 
-def getCfgOptionStr(config, section, name, default):
+async def sendMessageToIrcChannel(net, channel, reply_to, message, merge=False):
 	"""
-	PURPOSE:	Return string value of a setting (name) from section in config or default value
+	PURPOSE:	Send message to IRC channel on the network (net)
 	VERIFIED:	YES
 	"""
-	try:
-		option = config.get(section, name)
-		if (len(option) == 0):
-			option = default
-	except:
-		option = default
-	return option
+	await sendLinesToIrcChannel(net, channel, reply_to + ": " + message, merge)
 
-def getCfgOptionInt(config, section, name, default):
+async def sendLinesToIrcChannel(net, channel, text, merge=False):
 	"""
-	PURPOSE:	Return integer value of a setting (name) from section in config or default value
+	PURPOSE:	Send text to IRC channel on the network (net), line by line, lines longer than allowed by the protocol (512 bytes) are split, short lines are merged if merge is set
 	VERIFIED:	YES
 	"""
-	try:
-		option = config.getint(section, name)
-	except:
-		option = default
-	return option
+	for msg in packIrcLines(text.split('\n'), ircLineBudget(net.my_prefix, channel), merge):
+		net.irc.send(bytes("PRIVMSG " + channel + " :" + msg + "\n", "UTF-8"), PRIORITY_PRIVMSG)
 
-def getCfgOptionFloat(config, section, name, default):
+def getNickFromFull(full):	# 20241216
 	"""
-	PURPOSE:	Return float value of a setting (name) from section in config or default value
+	PURPOSE:	Return nick form full name
 	VERIFIED:	YES
 	"""
-	try:
-		option = config.getfloat(section, name)
-	except:
-		option = default
-	return option
+	i = full.find("!")
+	return full[:i] if (i >= 0) else ""
 
-def getCfgOptionBoolean(config, section, name, default):
+def ircLower(name):
 	"""
-	PURPOSE:	Return boolean value of a setting (name) from section in config or default value
+	PURPOSE:	Return case-insensitive key of the channel or nick name (RFC1459 casemapping)
 	VERIFIED:	YES
 	"""
-	try:
-		option = config.getboolean(section, name)
-	except:
-		option = default
-	return option
+	return name.translate(IRC_CASEMAP)
 
-def getFromModel(what, model, MODEL):
+def isOwner(who_full):
 	"""
-	PURPOSE:	Return "what" (api, type) of the model
+	PURPOSE:	Return True if the user (who_full: nick!user@host) matches one of the masks of owners of the bot (OWNERS)
 	VERIFIED:	YES
 	"""
-	for element in MODEL:
-		if (element[3].lower() == model.lower()):
-			match (what.lower()):
-				case "api":
-					return element[0].lower()
-				case "type":
-					return element[2].lower()
-				case _:
-					return ""
-	return ""
+	who = ircLower(who_full)
+	return any(fnmatch.fnmatchcase(who, mask) for mask in OWNERS)
 
-def createProfile(CHAN, who_nick):
+def historyStartTime(T):
 	"""
-	PURPOSE:	Return assistant's complete profile (instructions) with current date/time, configured context, tracking information, etc.
-	VERIFIED:	TO DO
+	PURPOSE:	Return the oldest timestamp of Q/A pairs to be kept based on time (T)
+							T > 0:	within last T seconds
+							T = 0:	keep no pairs
+							T < 0:	keep all pairs
+	VERIFIED:	YES
 	"""
-	""" prepare assistant's tracking information """
-	profile_hist = " On this channel (" + CHAN[0] + ") you "
-	if (CHAN[3] > 0):
-		if (CHAN[2] > 0):
-			profile_hist += "track previous " + str(CHAN[3]) + " questions/answers within last " + str(CHAN[2]) + " seconds."
-		elif (CHAN[2] == 0):
-			profile_hist += "do not track any previous questions/answers."
-		else:
-			profile_hist += "track previous " + str(CHAN[3]) + " questions/answers."
-	elif (CHAN[3] == 0):
-		profile_hist += "do not track any previous questions/answers."
-	elif (CHAN[3] < 0):
-		if (CHAN[2] > 0):
-			profile_hist += "track all previous questions/answers within last " + str(CHAN[2]) + " seconds."
-		elif (CHAN[2] == 0):
-			profile_hist += "do not track any previous questions/answers."
-		else:
-			profile_hist += "track all previous questions/answers."
+	if (T < 0):
+		return 0
+	elif (T == 0):
+		return 2 * int(nowUTC().timestamp())	# 20241206
 	else:
-		""" this point should never be reached """
-		profile_hist = ""
-	""" prepare assistant's complete profile (instructions) with current date/time, configured context tracking information """
-	profile = todayIsUTC() + " " + CHAN[1] + profile_hist
-	""" if use_nick is set """
-	if (CHAN[4]):
-		profile += " When responding, make sure you address the person using their nickname. This question was asked by a person who's nickname is " + who_nick + "."
-	""" add information about author and model """
-	profile += " As an IRC bot with the AI back-end from " + CHAN[7] + "(model: " + CHAN[5] + "), you were created and written by " + AUTHOR + ", and he can be contacted on IRCnet or IRCnet2 using his nickname '" + AUTHOR_NICK + "'."
-	profile += " You are currently running version " + VERSION + " and the latest version can be found on GitHub (" + GH + ")."
-	profile += " You are operating on public channels on IRC, so if anyone asks you about discussion with other users make sure to provide that information. "
-	""" return bot profile """
-	return profile
+		return int(nowUTC().timestamp()) - T	# 20241206
 
-def writeToLog(msg):
+class QAPair:
 	"""
-	PURPOSE:	Write to logfile
+	PURPOSE:	Compact Q/A history record, network, channel and nick strings (and their keys, ircLower) are interned, so repeated names are stored once
+							size is the approximate memory (bytes) used by the record, counted against the history budget
+							tokens is the estimated number of tokens of the question and answer, counted against the context budget
 	VERIFIED:	YES
 	"""
-	log = open(LOG, "a")
-	log.write(str(msg.strip()) + "\n")
-	log.close()
+	__slots__ = ("network", "channel", "channel_key", "ts", "nick", "nick_key", "question", "answer", "size", "tokens", "stored")
 
+	def __init__(self, network, channel, channel_key, ts, nick, nick_key, question, answer):
+		self.network = sys.intern(network)
+		self.channel = sys.intern(channel)
+		self.channel_key = sys.intern(channel_key)
+		self.ts = ts
+		self.nick = sys.intern(nick)
+		self.nick_key = sys.intern(nick_key)
+		self.question = question
+		self.answer = answer
+		self.size = QAPAIR_SIZE + sys.getsizeof(question) + sys.getsizeof(answer)
+		self.tokens = estimateTokens(question) + estimateTokens(answer)
+		self.stored = False
 
+class HistoryFile:
+	"""
+	PURPOSE:	Persistent (on-disk) Q/A history, SQLite database in WAL mode
+							Every answered question is appended (and committed) as it arrives, so history survives crash or restart of the bot
+							Records are read back per channel, only within the channel's history_time/history window
+	VERIFIED:	YES
+	"""
+	def __init__(self, path):
+		self.db = sqlite3.connect(path, timeout=HISTORY_MIGRATE_TIMEOUT)
+		self.db.execute("PRAGMA journal_mode=WAL")
+		self.db.execute("PRAGMA synchronous=NORMAL")
+		""" one process (e.g. of several workers opening the file at the same time) creates or migrates the file, the others wait for it and find it up to date """
+		self.db.execute("BEGIN IMMEDIATE")
+		self.db.execute("CREATE TABLE IF NOT EXISTS qa (channel_key TEXT, nick_key TEXT, ts INTEGER, channel TEXT, nick TEXT, question TEXT, answer TEXT, network TEXT NOT NULL DEFAULT '')")
+		if (self.db.execute("PRAGMA user_version").fetchone()[0] < HISTORY_VERSION):
+			""" files created before networks were supported have no network column, their records belong to the unnamed network """
+			if "network" not in [row[1] for row in self.db.execute("PRAGMA table_info(qa)")]:
+				self.db.execute("ALTER TABLE qa ADD COLUMN network TEXT NOT NULL DEFAULT ''")
+			""" keys written with other casemapping (before RFC1459 casemapping was used) are rewritten, so their records are found again """
+			self.db.create_function("irclower", 1, ircLower, deterministic=True)
+			self.db.execute("UPDATE qa SET channel_key = irclower(channel), nick_key = irclower(nick) WHERE (channel_key != irclower(channel)) OR (nick_key != irclower(nick))")
+			self.db.execute("DROP INDEX IF EXISTS qa_channel_ts")
+			self.db.execute("PRAGMA user_version = " + str(HISTORY_VERSION))
+		self.db.execute("CREATE INDEX IF NOT EXISTS qa_network_channel_ts ON qa (network, channel_key, ts)")
+		self.db.commit()
+		self.db.execute("PRAGMA busy_timeout = " + str(HISTORY_LOCK_TIMEOUT * 1000))
 
-"""
-LOAD CONFIGURATION
-	Name of the configuration file is passed as a command-line argument
-"""
-# Check if configuration file name was provided
-if (len(CONF_FILE)>0):
-	# Read configuration file
-	if os.path.isfile(CONF_FILE):
-		printInfo("Loading configuration file (" + CONF_FILE + ")")
-		config = configparser.ConfigParser()
+	def write(self, element):
+		"""
+		PURPOSE:	Append Q/A record (QAPair) to the file, errors (e.g. database is locked, disk is full) are logged, the record is then kept in memory only
+		"""
 		try:
-			config.read(CONF_FILE)
-		except Exception as e:
-			printError("Configuration file loading error.\n" + str(e) + "\n")
-			exit(1)
-	else:
-		printError("Specified configuration file (" + CONF_FILE + ") does not exist.\n")
-		exit(1)
-else:
-	printError("Missing configuration file name.\n\nUSAGE: " + PROG + " CONF_FILE\n")
-	exit(1)
-
-try:
-	# Set up AI model
-	AI_MODEL = config.get('AI', 'model').lower()
-	# Set up API KEY
-	AI_API_KEY = config.get('AI', 'api_key')
-	# Create list of ALL supported API and models
-	MODELS_API = []
-	MODELS_CHAT = []
-	MODELS_IMAGE = []
-	for element in MODEL:
-		# API
-		a = element[0].lower()
+			self.db.execute("INSERT INTO qa (channel_key, nick_key, ts, channel, nick, question, answer, network) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (element.channel_key, element.nick_key, element.ts, element.channel, element.nick, element.question, element.answer, element.network))
+			self.db.commit()
+		except sqlite3.Error as e:
+			printError("Unable to write to history file: " + str(e) + "\n")
+
+	def read(self, W, c, T, N):
+		"""
+		PURPOSE:	Return list of Q/A records (QAPair) for the channel (c: channel key) of the network (W) based on time (T) and number (N) per nick, oldest first, errors are logged (no records)
+		"""
+		if (T == 0) or (N == 0):
+			return []
 		try:
-			i = MODELS_API.index(a)
-		except:
-			MODELS_API.append(a)
-		# models
-		m = element[3].lower()
-		match (element[2].lower()):
-			case "chat":
-				MODELS_CHAT.append(m)
-			case "image":
-				MODELS_IMAGE.append(m)
+			rows = self.db.execute(
+				"SELECT network, channel, channel_key, ts, nick, nick_key, question, answer FROM ("
+				" SELECT *, ROW_NUMBER() OVER (PARTITION BY nick_key ORDER BY ts DESC) AS n FROM qa WHERE network = ? AND channel_key = ? AND ts >= ?"
+				") WHERE (? < 0) OR (n <= ?) ORDER BY ts",
+				(W, c, historyStartTime(T), N, N)).fetchall()
+		except sqlite3.Error as e:
+			printError("Unable to read from history file: " + str(e) + "\n")
+			return []
+		return [QAPair(*row) for row in rows]
+
+	def close(self):
+		self.db.close()
+
+class History:
+	"""
+	PURPOSE:	Q/A history store, indexed by (NETWORK, CHANNEL KEY, NICKNAME KEY), keys are case-insensitive names (ircLower) computed once by the caller
+							Each pair keeps its Q/A records (QAPair) in time order (deque), so lookup and trimming touch only the entries returned or removed
+							Memory is bounded by max_entries and max_bytes (0 = unlimited) for all channels together, the oldest records are evicted first
+							If history file (HistoryFile) is set, records are also saved on disk and loaded back lazily, on first use of the channel
+	VERIFIED:	YES
+	"""
+	def __init__(self, max_entries=0, max_bytes=0, file=None):
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		self.file = file
+		""" (network, channel) already loaded from the history file """
+		self.loaded = set()
+		""" (network, channel, nick) -> [TIMESTAMP, SUMMARY] running summary of Q/A records removed by discard() """
+		self.summaries = {}
+		""" (network, channel, nick) -> deque of records """
+		self.index = {}
+		""" (network, channel) -> set of nicks with history on that channel """
+		self.nicks = {}
+		""" all records in order of arrival (eviction order), records removed by trim() are skipped lazily """
+		self.order = collections.deque()
+		self.entries = 0
+		self.bytes = 0
+		self.evicted = 0
+
+	def __len__(self):
+		return self.entries
+
+	def keys(self, W, c, u):
+		"""
+		PURPOSE:	Return list of index keys for the channel (c) of the network (W) and user (u), all users of the channel if u is "" or "*"
+		"""
+		if (u == "") or (u == "*"):
+			return [(W, c, n) for n in self.nicks.get((W, c), ())]
+		return [(W, c, u)]
+
+	def load(self, W, c, T, N):
+		"""
+		PURPOSE:	Load Q/A records of the channel (c) of the network (W) from the history file based on time (T) and number (N), once per channel
+		"""
+		if (self.file is None) or ((W, c) in self.loaded):
+			return
+		self.loaded.add((W, c))
+		for element in self.file.read(W, c, T, N):
+			self.insert(element)
+		self.evict()
+
+	def append(self, element):
+		"""
+		PURPOSE:	Add Q/A record (QAPair) to the history (and history file) and evict the oldest records if over the budget
+		"""
+		if self.file is not None:
+			self.file.write(element)
+		self.insert(element)
+		self.evict()
+
+	def insert(self, element):
+		"""
+		PURPOSE:	Add Q/A record (QAPair) to the index
+		"""
+		k = (element.network, element.channel_key, element.nick_key)
+		QA = self.index.get(k)
+		if QA is None:
+			QA = self.index[k] = collections.deque()
+			self.nicks.setdefault(k[:2], set()).add(k[2])
+		""" answers may arrive out of order (concurrent questions), keep the deque sorted by TIMESTAMP """
+		i = len(QA)
+		while (i > 0) and (QA[i - 1].ts > element.ts):
+			i -= 1
+		QA.insert(i, element)
+		element.stored = True
+		self.order.append(element)
+		self.entries += 1
+		self.bytes += element.size
+
+	def evict(self):
+		"""
+		PURPOSE:	Remove the oldest records (of any channel) until history fits into max_entries and max_bytes
+		"""
+		while (len(self.order) > 0) and (((self.max_entries > 0) and (self.entries > self.max_entries)) or ((self.max_bytes > 0) and (self.bytes > self.max_bytes))):
+			element = self.order.popleft()
+			if not element.stored:
+				continue
+			k = (element.network, element.channel_key, element.nick_key)
+			QA = self.index[k]
+			QA.remove(element)
+			self.drop(element)
+			self.evicted += 1
+			if (len(QA) == 0):
+				self.remove(k)
+
+	def drop(self, element):
+		"""
+		PURPOSE:	Account for the record removed from the index
+		"""
+		element.stored = False
+		self.entries -= 1
+		self.bytes -= element.size
+
+	def get(self, W, c, u, T, N):
+		"""
+		PURPOSE:	Return list of Q/A records for the channel (c) of the network (W) from user (u) based on time (T) and number (N), oldest first
+		"""
+		if (N == 0):
+			return []
+		self.load(W, c, T, N)
+		t0 = historyStartTime(T)
+		keys = self.keys(W, c, u)
+		if (len(keys) == 1):
+			QA = self.index.get(keys[0], ())
+		else:
+			QA = list(heapq.merge(*[self.index[k] for k in keys], key=lambda element: element.ts))
+		QA_chan = []
+		for element in reversed(QA):
+			if (element.ts < t0) or (len(QA_chan) == N):
+				break
+			QA_chan.append(element)
+		QA_chan.reverse()
+		return QA_chan
+
+	def trim(self, W, c, u, T, N):
+		"""
+		PURPOSE:	Leave in history only Q/A records for the channel (c) of the network (W) from user (u) based on time (T) and number (N)
+		"""
+		self.load(W, c, T, N)
+		t0 = historyStartTime(T)
+		for k in self.keys(W, c, u):
+			QA = self.index.get(k)
+			if QA is None:
+				continue
+			while (len(QA) > 0) and (QA[0].ts < t0):
+				self.drop(QA.popleft())
+			if (N >= 0):
+				while (len(QA) > N):
+					self.drop(QA.popleft())
+			if (len(QA) == 0):
+				self.remove(k)
+		""" forget records removed by trim() once they are the majority of the eviction order """
+		if (len(self.order) > 2 * self.entries + 64):
+			self.order = collections.deque(element for element in self.order if element.stored)
+
+	def discard(self, elements):
+		"""
+		PURPOSE:	Remove given Q/A records (e.g. already summarized) from the history
+		"""
+		for element in elements:
+			if not element.stored:
+				continue
+			k = (element.network, element.channel_key, element.nick_key)
+			QA = self.index[k]
+			QA.remove(element)
+			self.drop(element)
+			if (len(QA) == 0):
+				self.remove(k)
+
+	def getSummary(self, W, c, u, T):
+		"""
+		PURPOSE:	Return running summary for the channel (c) of the network (W) and user (u) if it is still within time (T), or empty string
+		"""
+		summary = self.summaries.get((W, c, u))
+		if (summary is None) or (summary[0] < historyStartTime(T)):
+			return ""
+		return summary[1]
+
+	def setSummary(self, W, c, u, ts, text):
+		"""
+		PURPOSE:	Set running summary for the channel (c) of the network (W) and user (u), ts is TIMESTAMP of the newest summarized record
+		"""
+		self.summaries[(W, c, u)] = [ts, text]
+
+	def remove(self, k):
+		"""
+		PURPOSE:	Remove (network, channel, nick) key from the index
+		"""
+		del self.index[k]
+		self.summaries.pop(k, None)
+		nicks = self.nicks[k[:2]]
+		nicks.discard(k[2])
+		if (len(nicks) == 0):
+			del self.nicks[k[:2]]
+
+class AnswerCache:
+	"""
+	PURPOSE:	Cache of answers, indexed by (MODEL, PROFILE HASH, NORMALIZED QUESTION)
+							Entries expire after ttl seconds, memory is bounded by max_entries and max_bytes (0 = unlimited), the least recently used entries are evicted first
+	VERIFIED:	YES
+	"""
+	def __init__(self, ttl, max_entries=0, max_bytes=0):
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self.max_bytes = max_bytes
+		""" key -> [EXPIRES, ANSWER, SIZE], in order of use (least recently used first) """
+		self.entries = collections.OrderedDict()
+		self.bytes = 0
+		self.hits = 0
+		self.misses = 0
+		self.evicted = 0
+		self.expired = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	def get(self, key):
+		"""
+		PURPOSE:	Return cached answer for the key, None if not cached or expired
+		"""
+		element = self.entries.get(key)
+		if element is None:
+			self.misses += 1
+			return None
+		if (element[0] <= time.monotonic()):
+			self.remove(key)
+			self.expired += 1
+			self.misses += 1
+			return None
+		self.entries.move_to_end(key)
+		self.hits += 1
+		return element[1]
+
+	def put(self, key, answer):
+		"""
+		PURPOSE:	Cache the answer for the key, evict the least recently used entries above limits
+		"""
+		self.remove(key)
+		size = len(key[2].encode("UTF-8")) + len(answer.encode("UTF-8")) + CACHE_ENTRY_SIZE
+		self.entries[key] = [time.monotonic() + self.ttl, answer, size]
+		self.bytes += size
+		while (len(self.entries) > 0) and (((self.max_entries > 0) and (len(self.entries) > self.max_entries)) or ((self.max_bytes > 0) and (self.bytes > self.max_bytes))):
+			self.bytes -= self.entries.popitem(last=False)[1][2]
+			self.evicted += 1
+
+	def remove(self, key):
+		"""
+		PURPOSE:	Remove the key from the cache
+		"""
+		element = self.entries.pop(key, None)
+		if element is not None:
+			self.bytes -= element[2]
+
+	def ratio(self):
+		"""
+		PURPOSE:	Return hit ratio (0..1) of the cache
+		"""
+		lookups = self.hits + self.misses
+		return (self.hits / lookups) if (lookups > 0) else 0
+
+	def stats(self):
+		"""
+		PURPOSE:	Return statistics of the cache (text)
+		"""
+		return "entries: " + str(len(self.entries)) + ", bytes: " + str(self.bytes) + ", hits: " + str(self.hits) + ", misses: " + str(self.misses) + ", hit ratio: " + str(round(100 * self.ratio(), 1)) + "%, expired: " + str(self.expired) + ", evicted: " + str(self.evicted)
+
+def normalizeQuestion(question):
+	"""
+	PURPOSE:	Return question normalized for the answer cache (Unicode NFKC, case folded, single spaces, without trailing punctuation)
+	VERIFIED:	YES
+	"""
+	return " ".join(unicodedata.normalize("NFKC", question).casefold().split()).rstrip(" ?!.")
+
+def answerKey(CHAN, question):
+	"""
+	PURPOSE:	Return key of the answer to the question on the channel (CHAN), used by the answer cache and to share the answer of the same questions in flight
+							None if the answer depends on more than the question: not a chat channel, or history, summary or use_nick is set
+	VERIFIED:	YES
+	"""
+	if (CHAN[8] != "chat") or (CHAN[3] != 0) or (CHAN[10]) or (CHAN[4]):
+		return None
+	return (CHAN[5], hashlib.sha1(CHAN[11].encode("UTF-8")).hexdigest(), normalizeQuestion(question))
+
+def getChannelHistory(QA, W, c, u, T, N):
+	"""
+	PURPOSE:	Return list of Q/A pairs for the channel (c: channel key) of the network (W) from user (u: nick key) based on time (T) and number (N)
+	VERIFIED:	YES
+	"""
+	return QA.get(W, c, u, T, N)
+
+def leaveInChannelHistory(QA, W, c, u, T, N):
+	"""
+	PURPOSE:	Leave in history Q/A pairs for the channel (c: channel key) of the network (W) from user (u: nick key) based on time (T) and number (N)
+	VERIFIED:	YES
+	"""
+	QA.trim(W, c, u, T, N)
+
+def estimateTokens(text):
+	"""
+	PURPOSE:	Return estimated number of tokens of the message (text), ~4 bytes of UTF-8 per token plus per-message overhead
+	VERIFIED:	YES
+	"""
+	return (len(text.encode("UTF-8")) + 3) // 4 + MESSAGE_TOKENS
+
+def contextBudget(CHAN, profile):
+	"""
+	PURPOSE:	Return number of tokens available for previous Q/A pairs and the question on the channel (CHAN) with given profile
+							Model's context window (or max_context_tokens if lower) minus max_tokens reserved for the answer and the profile
+	VERIFIED:	YES
+	"""
+	window = getFromModel("context", CHAN[5], MODEL)
+	if (MAX_CONTEXT_TOKENS > 0) and ((window <= 0) or (MAX_CONTEXT_TOKENS < window)):
+		window = MAX_CONTEXT_TOKENS
+	return window - MAX_TOKENS - estimateTokens(profile)
+
+def prepMessages(QA, W, c, u, T, N, Q, B):
+	"""
+	PURPOSE:	Create list of AI-readable previous messages for the channel (c: channel key) of the network (W) from user (u: nick key) based on time (T) and number (N) and add current question (Q)
+							Previous Q/A pairs are packed newest first, as long as they fit into the token budget (B) together with the question
+	VERIFIED:	YES
+	"""
+	""" get previous Q/A pairs """
+	QA_chan = getChannelHistory(QA, W, c, u, T, N)
+	""" pick up the newest pairs which fit into the budget """
+	B -= estimateTokens(Q)
+	first = len(QA_chan)
+	while (first > 0) and (QA_chan[first - 1].tokens <= B):
+		first -= 1
+		B -= QA_chan[first].tokens
+	""" change into list of AI-readable messages (user/assistant pairs) """
+	messages = []
+	for element in QA_chan[first:]:
+		messages.append({"role": "user", "content": element.question})
+		messages.append({"role": "assistant", "content": element.answer})
+	""" append current question """
+	messages.append({"role": "user", "content": Q})
+	return messages
+
+def getCfgOptionStr(config, section, name, default):
+	"""
+	PURPOSE:	Return string value of a setting (name) from section in config or default value
+	VERIFIED:	YES
+	"""
+	try:
+		option = config.get(section, name)
+		if (len(option) == 0):
+			option = default
+	except:
+		option = default
+	return option
+
+def getCfgOptionInt(config, section, name, default):
+	"""
+	PURPOSE:	Return integer value of a setting (name) from section in config or default value
+	VERIFIED:	YES
+	"""
+	try:
+		option = config.getint(section, name)
+	except:
+		option = default
+	return option
+
+def getCfgOptionFloat(config, section, name, default):
+	"""
+	PURPOSE:	Return float value of a setting (name) from section in config or default value
+	VERIFIED:	YES
+	"""
+	try:
+		option = config.getfloat(section, name)
+	except:
+		option = default
+	return option
+
+def getCfgOptionBoolean(config, section, name, default):
+	"""
+	PURPOSE:	Return boolean value of a setting (name) from section in config or default value
+	VERIFIED:	YES
+	"""
+	try:
+		option = config.getboolean(section, name)
+	except:
+		option = default
+	return option
+
+def getFromModel(what, model, MODEL):
+	"""
+	PURPOSE:	Return "what" (api, type, context) of the model
+	VERIFIED:	YES
+	"""
+	for element in MODEL:
+		if (element[3].lower() == model.lower()):
+			match (what.lower()):
+				case "api":
+					return element[0].lower()
+				case "type":
+					return element[2].lower()
+				case "context":
+					return element[4]
+				case _:
+					return ""
+	return ""
+
+def importVendor(api):
+	"""
+	PURPOSE:	Return SDK module of the AI vendor (api), it is imported on first use only (vendors), so unused vendors cost nothing at startup
+	VERIFIED:	YES
+	"""
+	module = vendors.get(api)
+	if module is None:
+		t = time.perf_counter()
+		module = importlib.import_module(api)
+		vendor_import_times.setdefault(api, time.perf_counter() - t)
+		vendors[api] = module
+	return module
+
+def vendorErrors(name):
+	"""
+	PURPOSE:	Return tuple of exception classes (name, e.g. RateLimitError) of the AI vendors imported so far
+	VERIFIED:	YES
+	"""
+	return tuple(getattr(module, name) for module in list(vendors.values()))
+
+def getHttpClient(api):
+	"""
+	PURPOSE:	Return HTTP client (keep-alive connection pool) of the vendor (api), shared by all its AI clients
+							Pool size (AI_POOL_SIZE), keep-alive time (AI_POOL_KEEPALIVE) and HTTP/2 (AI_HTTP2) are configurable
+	VERIFIED:	YES
+	"""
+	if api not in AI_HTTP:
+		import httpx
+		limits = httpx.Limits(max_connections=AI_POOL_SIZE, max_keepalive_connections=AI_POOL_SIZE, keepalive_expiry=AI_POOL_KEEPALIVE)
+		AI_HTTP[api] = importVendor(api).DefaultAsyncHttpxClient(limits=limits, http2=AI_HTTP2)
+	return AI_HTTP[api]
+
+class AiClient:
+	"""
+	PURPOSE:	AI client of the vendor (api) using API KEY (api_key), the SDK is imported and the real client created on first use
+							Attributes of the real client (messages, chat, images) are passed through
+	VERIFIED:	YES
+	"""
+	def __init__(self, api, api_key):
+		self.api = api
+		self.api_key = api_key
+		self.client = None
+
+	def __getattr__(self, name):
+		if self.client is None:
+			base_url = API_BASE_URLS.get(self.api) or None
+			match (self.api):
+				case "anthropic":
+					self.client = importVendor("anthropic").AsyncAnthropic(api_key=self.api_key, base_url=base_url, max_retries=0, http_client=getHttpClient(self.api))
+				case "openai":
+					self.client = importVendor("openai").AsyncOpenAI(api_key=self.api_key, base_url=base_url, max_retries=0, http_client=getHttpClient(self.api))
+		return getattr(self.client, name)
+
+def createAiClient(api, api_key):
+	"""
+	PURPOSE:	Return AI client (AiClient) of the vendor (api) using API KEY (api_key), None if vendor is not supported
+							There is one client per vendor and API KEY (AI_CLIENTS), reused by all channels (configured and invited) and all clients of the vendor share one connection pool
+							Retries are handled by the bot (aiRequest), so they are disabled in the client, API endpoint of the vendor can be changed (API_BASE_URLS)
+	VERIFIED:	YES
+	"""
+	if api not in ["anthropic", "openai"]:
+		return None
+	k = (api, api_key)
+	if k not in AI_CLIENTS:
+		AI_CLIENTS[k] = AiClient(api, api_key)
+	return AI_CLIENTS[k]
+
+def createFallback(models, CHAN, api_keys):
+	"""
+	PURPOSE:	Return fallback chain (list of [MODEL, API_KEY, API, AI, PROFILE]) of the comma separated models (models) of the channel (CHAN: NAME ... SUMMARY)
+							Fallback model of the same vendor as the channel's model uses the same API KEY, other vendors use API KEY from api_keys
+							Fallback model must be of the same type as the model it replaces, its static profile is prepared here (once per channel)
+	VERIFIED:	YES
+	"""
+	fallback = []
+	for m in models.split(","):
+		m = m.strip().lower()
+		if (len(m) == 0):
+			continue
+		a = getFromModel("api", m, MODEL)
+		if (getFromModel("type", m, MODEL) != CHAN[8]):
+			raise ValueError("Fallback model " + m + " is not supported or of different type than " + CHAN[8])
+		ak = CHAN[6] if (a == CHAN[7]) else api_keys.get(a, "")
+		F = [m, ak, a, createAiClient(a, ak)]
+		fallback.append(F + [createProfile(CHAN[:5] + F[:3] + [CHAN[8], F[3]] + CHAN[10:11])])
+	return fallback
+
+def createProfile(CHAN):
+	"""
+	PURPOSE:	Return static part of assistant's profile (instructions) with configured context, tracking information, author, etc.
+							It does not change between questions, so it is prepared once per channel (CHAN[11]) and can be reused by provider's prompt caching
+	VERIFIED:	TO DO
+	"""
+	""" prepare assistant's tracking information """
+	profile_hist = " On this channel (" + CHAN[0] + ") you "
+	if (CHAN[3] > 0):
+		if (CHAN[2] > 0):
+			profile_hist += "track previous " + str(CHAN[3]) + " questions/answers within last " + str(CHAN[2]) + " seconds."
+		elif (CHAN[2] == 0):
+			profile_hist += "do not track any previous questions/answers."
+		else:
+			profile_hist += "track previous " + str(CHAN[3]) + " questions/answers."
+	elif (CHAN[3] == 0):
+		profile_hist += "do not track any previous questions/answers."
+	elif (CHAN[3] < 0):
+		if (CHAN[2] > 0):
+			profile_hist += "track all previous questions/answers within last " + str(CHAN[2]) + " seconds."
+		elif (CHAN[2] == 0):
+			profile_hist += "do not track any previous questions/answers."
+		else:
+			profile_hist += "track all previous questions/answers."
+	else:
+		""" this point should never be reached """
+		profile_hist = ""
+	""" prepare assistant's profile (instructions) with configured context tracking information """
+	profile = CHAN[1] + profile_hist
+	""" if use_nick is set """
+	if (CHAN[4]):
+		profile += " When responding, make sure you address the person using their nickname."
+	""" add information about author and model """
+	profile += " As an IRC bot with the AI back-end from " + CHAN[7] + "(model: " + CHAN[5] + "), you were created and written by " + AUTHOR + ", and he can be contacted on IRCnet or IRCnet2 using his nickname '" + AUTHOR_NICK + "'."
+	profile += " You are currently running version " + VERSION + " and the latest version can be found on GitHub (" + GH + ")."
+	profile += " You are operating on public channels on IRC, so if anyone asks you about discussion with other users make sure to provide that information. "
+	""" return bot profile """
+	return profile
+
+def createProfileSummary(who_nick, summary):
+	"""
+	PURPOSE:	Return part of assistant's profile with summary of earlier conversation, or empty string if there is no summary
+	VERIFIED:	YES
+	"""
+	if (len(summary) == 0):
+		return ""
+	return "Summary of your earlier conversation with " + who_nick + " on this channel: " + summary
+
+def createProfileVolatile(CHAN, who_nick):
+	"""
+	PURPOSE:	Return volatile part of assistant's profile (instructions) with current date/time and nickname of the person asking the question
+	VERIFIED:	YES
+	"""
+	profile = todayIsUTC()
+	""" if use_nick is set """
+	if (CHAN[4]):
+		profile += "This question was asked by a person who's nickname is " + who_nick + "."
+	return profile
+
+def anthropicRequest(profile, profile_summary, profile_volatile, messages):
+	"""
+	PURPOSE:	Return system prompt and messages (Anthropic) with cache_control breakpoints on the static profile and on the last previous Q/A pair
+							Volatile part of the profile is sent with the question, so it does not invalidate cached prefix (profile, summary, history)
+	VERIFIED:	YES
+	"""
+	system = [{"type": "text", "text": profile, "cache_control": {"type": "ephemeral"}}]
+	if (len(profile_summary) > 0):
+		system.append({"type": "text", "text": profile_summary})
+	messages = [] + messages
+	if (len(messages) > 1):
+		messages[-2] = {"role": messages[-2]["role"], "content": [{"type": "text", "text": messages[-2]["content"], "cache_control": {"type": "ephemeral"}}]}
+	messages[-1] = {"role": "user", "content": [{"type": "text", "text": profile_volatile}, {"type": "text", "text": messages[-1]["content"]}]}
+	return system, messages
+
+def openaiRequest(profile, profile_summary, profile_volatile, messages):
+	"""
+	PURPOSE:	Return messages (OpenAI) with static profile, summary and history first and volatile part of the profile just before the question
+							OpenAI caches the longest repeated prefix automatically
+	VERIFIED:	YES
+	"""
+	system = [{ "role": "system", "content": profile }]
+	if (len(profile_summary) > 0):
+		system.append({ "role": "system", "content": profile_summary })
+	return system + messages[:-1] + [{ "role": "system", "content": profile_volatile }] + messages[-1:]
+
+class AsyncLog:
+	"""
+	PURPOSE:	Log file written in the background, one JSON object per line (JSON lines)
+							write() only queues the record in memory, run() task writes queued records in batches every flush seconds (file I/O in a thread) and fsyncs the file every fsync seconds
+							The file is rotated when it would exceed max_bytes, or when the period of max_age seconds changes (e.g. every day at midnight UTC for 86400), 0 disables either
+							Rotated files are kept as FILE.1 (newest) .. FILE.backups, gzipped (FILE.N.gz) if compress is set, records above max_queue waiting for write are dropped
+	VERIFIED:	YES
+	"""
+	def __init__(self, path, max_bytes, max_age, backups, compress, flush, fsync, max_queue):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.max_age = max_age
+		self.backups = backups
+		self.compress = compress
+		self.flush = flush
+		self.fsync = fsync
+		self.max_queue = max_queue
+		self.queue = collections.deque()
+		self.dropped = 0
+		self.file = None
+		self.size = 0
+		""" period (time / max_age) the open file belongs to """
+		self.period = 0
+		self.synced = time.monotonic()
+		self.task = None
+		""" write running in a thread, only one at a time, so records are written in order and the file is rotated once """
+		self.writing = None
+
+	def write(self, record):
+		"""
+		PURPOSE:	Queue the record (dict) for writing, drop it if the queue is full
+		"""
+		if (len(self.queue) >= self.max_queue):
+			self.dropped += 1
+			return
+		self.queue.append(record)
+
+	def start(self):
+		"""
+		PURPOSE:	Start writing queued records in the background
+		"""
+		self.task = asyncio.create_task(self.run())
+
+	async def run(self):
+		"""
+		PURPOSE:	Write queued records every flush seconds
+		"""
+		while True:
+			await asyncio.sleep(self.flush)
+			data = self.take()
+			sync = (time.monotonic() - self.synced >= self.fsync)
+			if (len(data) > 0) or (sync and (self.file is not None)):
+				self.writing = asyncio.ensure_future(asyncio.to_thread(self.append, data, sync))
+				try:
+					""" cancelling this task (close) does not stop the thread, close() waits for it """
+					await asyncio.shield(self.writing)
+				except OSError as e:
+					printError("Unable to write to log file (" + self.path + "): " + str(e))
+				finally:
+					if self.writing.done():
+						self.writing = None
+
+	def take(self):
+		"""
+		PURPOSE:	Return queued records (and the number of dropped ones) as JSON lines (bytes), the queue is emptied
+		"""
+		lines = []
+		while (len(self.queue) > 0):
+			lines.append(json.dumps(self.queue.popleft(), ensure_ascii=False, separators=(",", ":")))
+		if (self.dropped > 0):
+			lines.append(json.dumps({ "ts": nowUTC().isoformat(timespec="milliseconds"), "dropped": self.dropped }, separators=(",", ":")))
+			self.dropped = 0
+		return "".join(line + "\n" for line in lines).encode("UTF-8")
+
+	def append(self, data, sync):
+		"""
+		PURPOSE:	Write data (bytes) to the file, rotate it first if needed, fsync it if sync is set (runs in a thread)
+		"""
+		if self.file is None:
+			self.open()
+		if (len(data) > 0) and (self.size > 0) and (((self.max_bytes > 0) and (self.size + len(data) > self.max_bytes)) or ((self.max_age > 0) and (int(time.time() / self.max_age) != self.period))):
+			self.rotate()
+		self.file.write(data)
+		self.file.flush()
+		self.size += len(data)
+		if sync:
+			os.fsync(self.file.fileno())
+			self.synced = time.monotonic()
+
+	def open(self):
+		"""
+		PURPOSE:	Open (append) the file, period of existing file is taken from its last modification
+		"""
+		self.file = open(self.path, "ab")
+		self.size = self.file.tell()
+		if (self.max_age > 0):
+			self.period = int((os.stat(self.path).st_mtime if (self.size > 0) else time.time()) / self.max_age)
+
+	def rotate(self):
+		"""
+		PURPOSE:	Close the file, shift rotated files (FILE.N -> FILE.N+1, the oldest is removed) and open a new file
+		"""
+		self.file.close()
+		self.file = None
+		suffix = ".gz" if (self.compress) else ""
+		if (self.backups > 0):
+			for i in range(self.backups - 1, 0, -1):
+				if os.path.exists(self.path + "." + str(i) + suffix):
+					os.replace(self.path + "." + str(i) + suffix, self.path + "." + str(i + 1) + suffix)
+			if (self.compress):
+				with open(self.path, "rb") as source, gzip.open(self.path + ".1.gz", "wb") as target:
+					shutil.copyfileobj(source, target)
+				os.remove(self.path)
+			else:
+				os.replace(self.path, self.path + ".1")
+		else:
+			os.remove(self.path)
+		self.open()
+
+	async def close(self):
+		"""
+		PURPOSE:	Stop writing in the background, wait for the write in progress, write remaining records and close the file
+		"""
+		if self.task is not None:
+			self.task.cancel()
+			self.task = None
+		if self.writing is not None:
+			try:
+				await self.writing
+			except OSError as e:
+				printError("Unable to write to log file (" + self.path + "): " + str(e))
+			self.writing = None
+		data = self.take()
+		try:
+			if (len(data) > 0):
+				self.append(data, True)
+		except OSError as e:
+			printError("Unable to write to log file (" + self.path + "): " + str(e))
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+def logRecord(CHAN, who_full, question):
+	"""
+	PURPOSE:	Return log record (dict) of the question (from who_full) on the channel (CHAN), model, tokens, latency and answer are filled in when it is answered
+	VERIFIED:	YES
+	"""
+	return { "ts": nowUTC().isoformat(timespec="milliseconds"), "network": CHAN[15].name, "channel": CHAN[0], "nick": who_full, "question": question, "model": CHAN[5], "tokens_in": None, "tokens_out": None, "latency": None, "cache": False, "coalesced": False, "answer": None }
+
+def writeToLog(record):
+	"""
+	PURPOSE:	Queue the record (dict) for the log file, worker process passes it to the supervisor which owns the log file
+	VERIFIED:	YES
+	"""
+	if (WORKER >= 0):
+		workerSend(["L", record])
+	elif log is not None:
+		log.write(record)
+
+class Histogram:
+	"""
+	PURPOSE:	Histogram of observed values with fixed upper bounds of the buckets (bounds), counts are preallocated, so observing the value only increments one of them
+	VERIFIED:	YES
+	"""
+	def __init__(self, bounds):
+		self.bounds = bounds
+		""" counts[i]: values in the bucket i (bounds[i - 1] < value <= bounds[i]), the last one is above all bounds (+Inf) """
+		self.counts = [0] * (len(bounds) + 1)
+		self.sum = 0.0
+
+	def observe(self, value):
+		"""
+		PURPOSE:	Count the value
+		"""
+		self.counts[bisect.bisect_left(self.bounds, value)] += 1
+		self.sum += value
+
+	def merge(self, counts, total):
+		"""
+		PURPOSE:	Add counts and sum (total) of another histogram with the same bounds
+		"""
+		for i in range(len(self.counts)):
+			self.counts[i] += counts[i]
+		self.sum += total
+
+	def quantile(self, q):
+		"""
+		PURPOSE:	Return estimated quantile (q: 0..1) of observed values, interpolated linearly within the bucket, 0 if nothing was observed
+		"""
+		rank = q * sum(self.counts)
+		seen = 0
+		for i in range(len(self.bounds)):
+			count = self.counts[i]
+			if (count > 0) and (seen + count >= rank):
+				lower = self.bounds[i - 1] if (i > 0) else 0
+				return lower + (self.bounds[i] - lower) * (rank - seen) / count
+			seen += count
+		return self.bounds[-1] if (self.counts[-1] > 0) else 0
+
+class Metrics:
+	"""
+	PURPOSE:	Registry of metrics (METRICS) of this process: histograms and counters by label values (tuple, e.g. network, channel, model)
+							Metrics are recorded by the event loop only, so no locks are needed, histogram of new label values is created on its first use
+							snapshot() returns them as JSON-serializable list, so metrics of worker processes can be merged by the supervisor
+							Gauges of state kept in each process (e.g. answer cache) are merged as counters too, so they are summed over all processes
+	VERIFIED:	YES
+	"""
+	def __init__(self):
+		""" (NAME, LABELS) -> Histogram """
+		self.histograms = {}
+		""" (NAME, LABELS) -> value of the counter """
+		self.counters = {}
+
+	def observe(self, name, labels, value):
+		"""
+		PURPOSE:	Add the value to the histogram (name) of the label values (labels)
+		"""
+		histogram = self.histograms.get((name, labels))
+		if histogram is None:
+			histogram = self.histograms[(name, labels)] = Histogram(LATENCY_BUCKETS)
+		histogram.observe(value)
+
+	def inc(self, name, labels, value=1):
+		"""
+		PURPOSE:	Increase the counter (name) of the label values (labels)
+		"""
+		key = (name, labels)
+		self.counters[key] = self.counters.get(key, 0) + value
+
+	def snapshot(self):
+		"""
+		PURPOSE:	Return all metrics as list of [NAME, LABELS, COUNTS, SUM] (histogram) and [NAME, LABELS, VALUE] (counter)
+		"""
+		return [[k[0], k[1], h.counts, h.sum] for k, h in self.histograms.items()] + [[k[0], k[1], v] for k, v in self.counters.items()]
+
+	def merge(self, snapshot):
+		"""
+		PURPOSE:	Add metrics from the snapshot (e.g. of the worker process)
+		"""
+		for m in snapshot:
+			key = (m[0], tuple(m[1]))
+			if (len(m) == 4):
+				if key not in self.histograms:
+					self.histograms[key] = Histogram(LATENCY_BUCKETS)
+				self.histograms[key].merge(m[2], m[3])
+			else:
+				self.inc(key[0], key[1], m[2])
+
+	def total(self, name):
+		"""
+		PURPOSE:	Return sum of the counter (name) over all label values
+		"""
+		return sum(v for k, v in self.counters.items() if (k[0] == name))
+
+	def histogram(self, name):
+		"""
+		PURPOSE:	Return histogram (name) of all label values merged together
+		"""
+		merged = Histogram(LATENCY_BUCKETS)
+		for k, h in self.histograms.items():
+			if (k[0] == name):
+				merged.merge(h.counts, h.sum)
+		return merged
+
+	def render(self, gauges):
+		"""
+		PURPOSE:	Return metrics and gauges (list of [NAME, LABELS, VALUE]) in Prometheus text format
+		"""
+		lines = []
+		for name, (type, labels, help) in METRICS.items():
+			lines.append("# HELP " + name + " " + help)
+			lines.append("# TYPE " + name + " " + type)
+			match (type):
+				case "histogram":
+					for k, h in self.histograms.items():
+						if (k[0] != name):
+							continue
+						count = 0
+						for i in range(len(h.counts)):
+							count += h.counts[i]
+							le = str(h.bounds[i]) if (i < len(h.bounds)) else "+Inf"
+							lines.append(name + "_bucket" + metricLabels(labels + ("le",), k[1] + (le,)) + " " + str(count))
+						lines.append(name + "_sum" + metricLabels(labels, k[1]) + " " + repr(h.sum))
+						lines.append(name + "_count" + metricLabels(labels, k[1]) + " " + str(count))
+				case "counter":
+					for k, v in self.counters.items():
+						if (k[0] == name):
+							lines.append(name + metricLabels(labels, k[1]) + " " + str(v))
+				case "gauge":
+					for g in gauges + [[k[0], k[1], v] for k, v in self.counters.items()]:
+						if (g[0] == name):
+							lines.append(name + metricLabels(labels, g[1]) + " " + str(g[2]))
+		return "\n".join(lines) + "\n"
+
+def metricLabels(names, values):
+	"""
+	PURPOSE:	Return labels ({name="value",...}) of the metric in Prometheus text format, values are escaped
+	VERIFIED:	YES
+	"""
+	if (len(names) == 0):
+		return ""
+	return "{" + ",".join(n + "=\"" + str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") + "\"" for n, v in zip(names, values)) + "}"
+
+def channelLabels(CHAN):
+	"""
+	PURPOSE:	Return label values (network, channel, model) of the channel (CHAN) for metrics
+	VERIFIED:	YES
+	"""
+	return (CHAN[15].name, CHAN[0], CHAN[5])
+
+def observeFirstToken(CHAN, started):
+	"""
+	PURPOSE:	Record time to the first token of the answer of the model of the channel (CHAN) to the request sent at started (monotonic), if not recorded yet (started is 0)
+							Return 0, so the caller can pass it back for the next tokens
+	VERIFIED:	YES
+	"""
+	if (started > 0):
+		metrics.observe("aibot_first_token_seconds", channelLabels(CHAN), time.monotonic() - started)
+	return 0
+
+
+
+"""
+LOAD CONFIGURATION
+	Name of the configuration file is passed as a command-line argument
+"""
+def loadConfig(conf_file):
+	"""
+	PURPOSE:	Load configuration file (conf_file) into GLOBAL settings, exit if it is missing or invalid
+	VERIFIED:	YES
+	"""
+	global ACCEPT_INVITES, AI, AI_API, AI_API_KEY, AI_CLIENTS, AI_HTTP, AI_HTTP2, AI_MODEL, AI_POOL_KEEPALIVE, AI_POOL_SIZE, AI_TYPE, API_BASE_URLS
+	global API_KEYS, BREAKER_COOLDOWN, BREAKER_FAILURES, CACHE, CACHE_MAX_BYTES, CACHE_MAX_ENTRIES, CACHE_TTL, CONTEXT, DEBUG, FALLBACK
+	global FREQUENCY_PENALTY, HEDGE_DELAY, HISTORY, HISTORY_FILE, HISTORY_MAX_BYTES, HISTORY_MAX_ENTRIES, HISTORY_TIME, LOG_BACKUPS, LOG_COMPRESS
+	global LOG_FILE, LOG_FLUSH, LOG_FSYNC, LOG_MAX_BYTES, LOG_MAX_QUEUE, LOG_ROTATE, MAX_CHANNEL_REQUESTS, MAX_CONTEXT_TOKENS, MAX_NICK_QUEUE
+	global MAX_NICK_REQUESTS, MAX_QUEUE, MAX_REQUESTS, MAX_TOKENS, MERGE_LINES, METRICS_ADDRESS, METRICS_PORT, MODELS, MODELS_API, MODELS_CHAT
+	global MODELS_IMAGE, NETWORKS, OWNERS, PRESENCE_PENALTY
+	global REJOIN_INVITED, REQUEST_TIMEOUT, RETRY_BUDGET, SERVER, STREAM, SUMMARY, SUMMARY_AI, SUMMARY_API, SUMMARY_API_KEY, SUMMARY_KEEP
+	global SUMMARY_MODEL, TEMPERATURE, TOP_P, USE_NICK, WORKERS
+	# Check if configuration file name was provided
+	if (len(conf_file)>0):
+		# Read configuration file
+		if os.path.isfile(conf_file):
+			printInfo("Loading configuration file (" + conf_file + ")")
+			config = configparser.ConfigParser()
+			try:
+				config.read(conf_file)
+			except Exception as e:
+				printError("Configuration file loading error.\n" + str(e) + "\n")
+				exit(1)
+		else:
+			printError("Specified configuration file (" + conf_file + ") does not exist.\n")
+			exit(1)
+	else:
+		printError("Missing configuration file name.\n\nUSAGE: " + PROG + " CONF_FILE [--startup-profile]\n")
+		exit(1)
+
+	try:
+		# Set up AI model
+		AI_MODEL = config.get('AI', 'model').lower()
+		# Set up API KEY
+		AI_API_KEY = config.get('AI', 'api_key')
+		# Create list of ALL supported API and models
+		MODELS_API = []
+		MODELS_CHAT = []
+		MODELS_IMAGE = []
+		for element in MODEL:
+			# API
+			a = element[0].lower()
+			try:
+				i = MODELS_API.index(a)
+			except:
+				MODELS_API.append(a)
+			# models
+			m = element[3].lower()
+			match (element[2].lower()):
+				case "chat":
+					MODELS_CHAT.append(m)
+				case "image":
+					MODELS_IMAGE.append(m)
+				case _:
+					""" Unsupported model type """
+		MODELS = MODELS_CHAT + MODELS_IMAGE
+		# Set up registry of AI clients (one per vendor and API KEY) and their connection pools (one per vendor)
+		AI_CLIENTS = {}
+		AI_HTTP = {}
+		AI_POOL_SIZE = max(1, getCfgOptionInt(config, "AI", "pool_size", 20))
+		AI_POOL_KEEPALIVE = getCfgOptionFloat(config, "AI", "pool_keepalive", 30)
+		AI_HTTP2 = getCfgOptionBoolean(config, "AI", "http2", False)
+		if (AI_HTTP2) and (importlib.util.find_spec("h2") is None):
+			printError("HTTP/2 requires h2 package (pip3 install httpx[http2]), using HTTP/1.1.\n")
+			AI_HTTP2 = False
+		API_BASE_URLS = {}
+		for a in MODELS_API:
+			API_BASE_URLS[a] = getCfgOptionStr(config, "AI", a + "_base_url", "")
+		# Create AI object based on AI_API and assign AI_API_KEY
+		AI_API = getFromModel("api", AI_MODEL, MODEL)
+		AI = createAiClient(AI_API, AI_API_KEY)
+		if AI is None:
+			printError("Unsupported AI model selected (GLOBAL).\n")
+			exit(1)
+		AI_TYPE = getFromModel("type", AI_MODEL, MODEL)
+		match (AI_TYPE):
+			case "chat" | "image":
+				""" OK """
 			case _:
-				""" Unsupported model type """
-	MODELS = MODELS_CHAT + MODELS_IMAGE
-	# Create AI object based on AI_API and assign AI_API_KEY
-	AI_API = getFromModel("api", AI_MODEL, MODEL)
-	match (AI_API):
+				printError("Unsupported AI model type selected (GLOBAL).\n")
+				exit(1)
+
+		#set GLOBAL variables
+		CONTEXT = getCfgOptionStr(config, "AI", "context", "You are helpful and friendly assistant.")
+		HISTORY_TIME = getCfgOptionInt(config, "AI", "history_time", 0)
+		HISTORY = getCfgOptionInt(config, "AI", "history", 0)
+		USE_NICK = getCfgOptionBoolean(config, "AI", "use_nick", False)
+		HISTORY_MAX_ENTRIES = getCfgOptionInt(config, "AI", "history_max_entries", 0)
+		HISTORY_MAX_BYTES = getCfgOptionInt(config, "AI", "history_max_bytes", 16777216)
+		HISTORY_FILE = getCfgOptionStr(config, "AI", "history_file", "")
+
+		# Set up cache of answers
+		CACHE = getCfgOptionBoolean(config, "AI", "cache", False)
+		CACHE_TTL = getCfgOptionInt(config, "AI", "cache_ttl", 600)
+		CACHE_MAX_ENTRIES = getCfgOptionInt(config, "AI", "cache_max_entries", 1000)
+		CACHE_MAX_BYTES = getCfgOptionInt(config, "AI", "cache_max_bytes", 1048576)
+
+		# Set up AI parameters
+		TEMPERATURE = getCfgOptionFloat(config, "AI", "temperature", 0.5)
+		TOP_P = getCfgOptionInt(config, "AI", "top_p", 1)
+		MAX_TOKENS = getCfgOptionInt(config, "AI", "max_tokens", 1000)
+		MAX_CONTEXT_TOKENS = getCfgOptionInt(config, "AI", "max_context_tokens", 0)
+		FREQUENCY_PENALTY = getCfgOptionInt(config, "AI", "frequency_penalty", 0)
+		PRESENCE_PENALTY = getCfgOptionInt(config, "AI", "presence_penalty", 0)
+		REQUEST_TIMEOUT = getCfgOptionInt(config, "AI", "request_timeout", 60)
+		RETRY_BUDGET = getCfgOptionInt(config, "AI", "retry_budget", 10)
+
+		# Set up fallback models, hedging and circuit breakers
+		API_KEYS = {}
+		for a in MODELS_API:
+			API_KEYS[a] = getCfgOptionStr(config, "AI", a + "_api_key", AI_API_KEY)
+		FALLBACK = getCfgOptionStr(config, "AI", "fallback", "")
+		HEDGE_DELAY = getCfgOptionFloat(config, "AI", "hedge_delay", 10)
+		BREAKER_FAILURES = getCfgOptionInt(config, "AI", "breaker_failures", 5)
+		BREAKER_COOLDOWN = getCfgOptionInt(config, "AI", "breaker_cooldown", 30)
+		STREAM = getCfgOptionBoolean(config, "AI", "stream", False)
+
+		# Set up limits of AI requests
+		MAX_REQUESTS = max(1, getCfgOptionInt(config, "AI", "max_requests", 8))
+		MAX_CHANNEL_REQUESTS = max(1, getCfgOptionInt(config, "AI", "max_channel_requests", 2))
+		MAX_NICK_REQUESTS = max(1, getCfgOptionInt(config, "AI", "max_nick_requests", 1))
+		MAX_QUEUE = getCfgOptionInt(config, "AI", "max_queue", 32)
+		MAX_NICK_QUEUE = getCfgOptionInt(config, "AI", "max_nick_queue", 2)
+		WORKERS = getCfgOptionInt(config, "AI", "workers", 0)
+
+		# Set up rolling summary of older questions/answers
+		SUMMARY = getCfgOptionBoolean(config, "AI", "summary", False)
+		SUMMARY_KEEP = max(1, getCfgOptionInt(config, "AI", "summary_keep", 3))
+		SUMMARY_MODEL = getCfgOptionStr(config, "AI", "summary_model", "").lower()
+		SUMMARY_API = ""
+		SUMMARY_AI = None
+		if (len(SUMMARY_MODEL) > 0):
+			SUMMARY_API = getFromModel("api", SUMMARY_MODEL, MODEL)
+			SUMMARY_API_KEY = getCfgOptionStr(config, "AI", "summary_api_key", AI_API_KEY)
+			SUMMARY_AI = createAiClient(SUMMARY_API, SUMMARY_API_KEY)
+			if SUMMARY_AI is None:
+				printError("Unsupported AI model selected (summary).\n")
+				exit(1)
+			if (getFromModel("type", SUMMARY_MODEL, MODEL) != "chat"):
+				printError("Unsupported AI model type selected (summary).\n")
+				exit(1)
+
+		# Validate GLOBAL fallback, its chain (with profiles) is created for each channel inheriting it
+		createFallback(FALLBACK, ["", CONTEXT, HISTORY_TIME, HISTORY, USE_NICK, AI_MODEL, AI_API_KEY, AI_API, AI_TYPE, AI, SUMMARY], API_KEYS)
+
+		# Set up global IRC settings
+		DEBUG = getCfgOptionBoolean(config, "IRC", "debug", False)
+		ACCEPT_INVITES = getCfgOptionBoolean(config, "IRC", "accept_invites", False)
+		REJOIN_INVITED = getCfgOptionBoolean(config, "IRC", "rejoin_invited", False)
+		MERGE_LINES = getCfgOptionBoolean(config, "IRC", "merge_lines", False)
+
+		# Set up log file
+		LOG_FILE = getCfgOptionStr(config, "IRC", "log_file", LOG)
+		LOG_MAX_BYTES = getCfgOptionInt(config, "IRC", "log_max_bytes", 10485760)
+		LOG_ROTATE = getCfgOptionInt(config, "IRC", "log_rotate", 0)
+		LOG_BACKUPS = getCfgOptionInt(config, "IRC", "log_backups", 5)
+		LOG_COMPRESS = getCfgOptionBoolean(config, "IRC", "log_compress", True)
+		LOG_FLUSH = getCfgOptionFloat(config, "IRC", "log_flush", 1.0)
+		LOG_FSYNC = getCfgOptionFloat(config, "IRC", "log_fsync", 10.0)
+		LOG_MAX_QUEUE = getCfgOptionInt(config, "IRC", "log_max_queue", 10000)
+
+		# Set up metrics endpoint and owners of the bot (!stats)
+		METRICS_PORT = getCfgOptionInt(config, "IRC", "metrics_port", 0)
+		METRICS_ADDRESS = getCfgOptionStr(config, "IRC", "metrics_address", "127.0.0.1")
+		OWNERS = [ircLower(mask.strip()) for mask in getCfgOptionStr(config, "IRC", "owner", "").split(",") if (len(mask.strip()) > 0)]
+
+		"""
+		Load servers settings
+			ELEMENT FORMAT: NAME, PORT, TLS, PASSWORD, IDENT, REALNAME, NICKNAME, SASL_MECHANISM, SASL_USERNAME, SASL_PASSWORD, FLOOD_BURST, FLOOD_RATE, NETWORK
+		"""
+		i = 0
+		SERVER = []
+		while True:
+			try:
+				ist = str(i)
+				s = getCfgOptionStr(config, "IRC", "server[" + ist + "].name", "")
+				p = getCfgOptionInt(config, "IRC", "server[" + ist + "].port", 6667)
+				tls = getCfgOptionBoolean(config, "IRC", "server[" + ist + "].tls", False)
+				pw = getCfgOptionStr(config, "IRC", "server[" + ist + "].password", "")
+				id = getCfgOptionStr(config, "IRC", "server[" + ist + "].ident", "")
+				rn = getCfgOptionStr(config, "IRC", "server[" + ist + "].realname", "")
+				n = getCfgOptionStr(config, "IRC", "server[" + ist + "].nickname", "")[:9]
+				saslm = getCfgOptionStr(config, "IRC", "server[" + ist + "].sasl_mechanism", "")
+				saslu = getCfgOptionStr(config, "IRC", "server[" + ist + "].sasl_username", "")
+				saslp = getCfgOptionStr(config, "IRC", "server[" + ist + "].sasl_password", "")
+				fb = getCfgOptionInt(config, "IRC", "server[" + ist + "].flood_burst", 5)
+				fr = getCfgOptionFloat(config, "IRC", "server[" + ist + "].flood_rate", 0.5)
+				nw = getCfgOptionStr(config, "IRC", "server[" + ist + "].network", "")
+				if ((len(s) == 0) | (len(id) == 0) | (len(n) == 0)):
+					break
+				SERVER.append([s, p, tls, pw, id, rn, n, saslm, saslu, saslp, fb, fr, nw])
+				i += 1
+			except:
+				break
+		if (len(SERVER) == 0):
+			printError("Invalid server[" + ist + "] settings.")
+			exit(1)
+
+		"""
+		Group servers into networks (by NETWORK), the bot is connected to all networks at the same time
+		"""
+		NETWORKS = []
+		for element in SERVER:
+			if getNetwork(element[12], NETWORKS) is None:
+				NETWORKS.append(Network(element[12], [S for S in SERVER if (S[12].lower() == element[12].lower())]))
+
+		"""
+		Load channels settings
+			ELEMENT FORMAT: NAME, CONTEXT, HISTORY_TIME, HISTORY, USE_NICK, MODEL, API_KEY, API, TYPE, AI(var), SUMMARY, PROFILE (static part), MERGE_LINES, FALLBACK (list of [MODEL, API_KEY, API, AI]), CACHE, NETWORK(var), KEY (ircLower of NAME)
+			Channels are kept by their network (Network.channels)
+		"""
+		i = 0
+		while True:
+			c = ""
+			try:
+				ist = str(i)
+				c = getCfgOptionStr(config, "IRC", "channel[" + ist + "].name", "")
+				if (len(c) == 0):
+					break
+				cx = getCfgOptionStr(config, "IRC", "channel[" + ist + "].context", CONTEXT)
+				ht = getCfgOptionInt(config, "IRC", "channel[" + ist + "].history_time", HISTORY_TIME)
+				h = getCfgOptionInt(config, "IRC", "channel[" + ist + "].history", HISTORY)
+				u = getCfgOptionBoolean(config, "IRC", "channel[" + ist + "].use_nick", USE_NICK)
+				m = getCfgOptionStr(config, "IRC", "channel[" + ist + "].model", AI_MODEL)
+				ak = getCfgOptionStr(config, "IRC", "channel[" + ist + "].api_key", AI_API_KEY)
+				sm = getCfgOptionBoolean(config, "IRC", "channel[" + ist + "].summary", SUMMARY)
+				ml = getCfgOptionBoolean(config, "IRC", "channel[" + ist + "].merge_lines", MERGE_LINES)
+				ca = getCfgOptionBoolean(config, "IRC", "channel[" + ist + "].cache", CACHE)
+				cn = getCfgOptionStr(config, "IRC", "channel[" + ist + "].network", SERVER[0][12])
+				fb = getCfgOptionStr(config, "IRC", "channel[" + ist + "].fallback", None)
+			except:
+				break
+			""" invalid settings of the channel stop the bot (outside of the try above, which ends the list of channels) """
+			net = getNetwork(cn, NETWORKS)
+			if net is None:
+				printError("Unknown network " + cn + " (channel: " + c + ").\n")
+				exit(1)
+			api = getFromModel("api", m, MODEL)
+			ai = createAiClient(api, ak)
+			if ai is None:
+				printError("Unsupported AI model selected (channel: " + c + ").\n")
+				exit(1)
+			t = getFromModel("type", m, MODEL)
+			match (t):
+				case "chat" | "image":
+					""" OK """
+				case _:
+					printError("Unsupported AI model type selected (channel: " + c + ").\n")
+					exit(1)
+			""" GLOBAL fallback is inherited only by chat channels with the model of the same type as GLOBAL model """
+			if fb is None:
+				fb = FALLBACK if (t == "chat") and (t == AI_TYPE) else ""
+			try:
+				fallback = createFallback(fb, [c, cx, ht, h, u, m, ak, api, t, ai, sm], API_KEYS)
+			except ValueError as e:
+				printError(str(e) + " (channel: " + c + ").\n")
+				exit(1)
+			if ircLower(c) not in net.channel_keys:
+				CHAN = [c, cx, ht, h, u, m, ak, api, t, ai, sm]
+				net.addChannel(CHAN + [createProfile(CHAN), ml, fallback, ca, net])
+				net.joins.append(c)
+			i += 1
+
+		# SDKs of AI vendors are imported on first use, make sure they are installed
+		for a in sorted(set(client.api for client in AI_CLIENTS.values())):
+			if importlib.util.find_spec(a) is None:
+				printError("Missing " + a + " package (pip3 install " + a + ").\n")
+				exit(1)
+
+	except Exception as e:
+		printError("Missing or invalid configuration option(s)\n" + str(e) + "\n")
+		exit(1)
+
+"""
+MAIN
+"""
+"""
+previous_QA (Q/A history table)
+	ELEMENT FORMAT: QAPair (CHANNEL, TIMESTAMP, NICKNAME, QUESTION, ANSWER)
+"""
+previous_QA = None
+"""
+answer_cache (answers of questions not depending on history)
+"""
+answer_cache = None
+"""
+inflight (key of the question in flight -> list of [NICKNAME, TIMESTAMP, QUESTION, WHO_FULL, NICKNAME KEY] waiting for the same answer)
+"""
+inflight = {}
+"""
+metrics (metrics of this process), metrics_server (HTTP server of the metrics endpoint, None if disabled)
+"""
+metrics = None
+metrics_server = None
+"""
+supervisor (pool of worker processes answering questions, None if questions are answered in this process)
+"""
+supervisor = None
+"""
+dns_cache (resolved addresses of IRC servers: (host, port) -> [EXPIRES, addresses])
+"""
+dns_cache = {}
+"""
+tls_sessions (server -> TLS session to resume), tls_context (SSL/TLS context shared by all connections)
+"""
+tls_sessions = {}
+tls_context = None
+"""
+log (log file of answered questions written in the background, None if disabled or in the worker process)
+"""
+log = None
+"""
+tasks (AI requests in flight)
+	Strong references are kept here, so running tasks are not garbage collected
+"""
+tasks = set()
+"""
+retry_budget ((network, channel) -> times of retries within last minute)
+"""
+retry_budget = {}
+"""
+breakers (vendor -> circuit breaker)
+"""
+breakers = {}
+"""
+scheduler (queue and limits of questions to AI)
+"""
+scheduler = None
+"""
+summarizing ((network, channel, nick) keys with summary being prepared)
+"""
+summarizing = set()
+"""
+vendors (AI vendor -> SDK module imported so far), vendor_import_times (AI vendor -> seconds its SDK took to import)
+"""
+vendors = {}
+vendor_import_times = {}
+"""
+startup_profile (list of [PHASE, SECONDS] measured from START_TIME), startup_reported (profile has been already reported), vendors_preloaded (SDKs of AI vendors used by the channels are imported)
+"""
+startup_profile = []
+startup_reported = False
+vendors_preloaded = False
+
+def setupState():
+	"""
+	PURPOSE:	Create state depending on configuration: Q/A history (loaded from history file), answer cache, log file, scheduler and metrics
+	VERIFIED:	YES
+	"""
+	global previous_QA, answer_cache, log, scheduler, metrics
+	""" in supervisor mode questions are answered by the worker processes, only they open the history file """
+	if (len(HISTORY_FILE) > 0) and ((WORKERS <= 0) or (WORKER >= 0)):
+		try:
+			printInfo("Loading history file (" + HISTORY_FILE + ")")
+			previous_QA = History(HISTORY_MAX_ENTRIES, HISTORY_MAX_BYTES, HistoryFile(HISTORY_FILE))
+		except sqlite3.Error as e:
+			printError("History file loading error.\n" + str(e) + "\n")
+			exit(1)
+	else:
+		previous_QA = History(HISTORY_MAX_ENTRIES, HISTORY_MAX_BYTES)
+	answer_cache = AnswerCache(CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+	log = AsyncLog(LOG_FILE, LOG_MAX_BYTES, LOG_ROTATE, LOG_BACKUPS, LOG_COMPRESS, LOG_FLUSH, LOG_FSYNC, LOG_MAX_QUEUE) if (len(LOG_FILE) > 0) and (WORKER < 0) else None
+	scheduler = Scheduler(MAX_REQUESTS, MAX_CHANNEL_REQUESTS, MAX_NICK_REQUESTS, MAX_QUEUE, MAX_NICK_QUEUE)
+	metrics = Metrics()
+
+def markStartup(phase):
+	"""
+	PURPOSE:	Record the startup phase (phase) which has just finished, with the time since START_TIME
+	VERIFIED:	YES
+	"""
+	startup_profile.append([phase, time.perf_counter() - START_TIME])
+
+def reportStartup():
+	"""
+	PURPOSE:	Print startup profile (--startup-profile): every phase with its duration and the time since START_TIME
+							It is printed once, when the bot is connected to all IRC networks and SDKs of AI vendors are imported
+	VERIFIED:	YES
+	"""
+	global startup_reported
+	if (startup_reported) or not (STARTUP_PROFILE) or not (vendors_preloaded) or any(net.irc is None for net in NETWORKS):
+		return
+	startup_reported = True
+	printInfo("Startup profile (seconds):")
+	previous = 0
+	for phase, t in startup_profile:
+		print("\t" + format(t - previous, "8.3f") + "  " + format(t, "8.3f") + "  " + phase)
+		previous = t
+	for api in vendor_import_times:
+		print("\t" + format(vendor_import_times[api], "8.3f") + "  " + " " * 8 + "  import " + api)
+
+def aiErrorRetryAfter(e):
+	"""
+	PURPOSE:	Return delay (seconds) requested by the API in retry-after(-ms) header of the error response, or -1 if not present
+	VERIFIED:	YES
+	"""
+	response = getattr(e, "response", None)
+	if response is None:
+		return -1
+	try:
+		headers = response.headers
+		if headers.get("retry-after-ms") is not None:
+			return float(headers.get("retry-after-ms")) / 1000
+		retry_after = headers.get("retry-after")
+		if retry_after is None:
+			return -1
+		try:
+			return float(retry_after)
+		except ValueError:
+			return max(0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+	except Exception:
+		return -1
+
+def isAiErrorRetryable(e):
+	"""
+	PURPOSE:	Return True if the error of AI API (Anthropic or OpenAI) is transient: connection error, timeout, 408/409/429 or 5xx status
+	VERIFIED:	YES
+	"""
+	if isinstance(e, vendorErrors("APIConnectionError")):
+		return True
+	if isinstance(e, vendorErrors("APIStatusError")):
+		return (e.status_code in (408, 409, 429)) or (e.status_code >= 500)
+	return False
+
+def describeAiError(e):
+	"""
+	PURPOSE:	Return description of the error of AI API (Anthropic or OpenAI)
+	VERIFIED:	YES
+	"""
+	if isinstance(e, vendorErrors("APITimeoutError") + (asyncio.TimeoutError,)):
+		return "The request timed out (request_timeout: " + str(REQUEST_TIMEOUT) + " seconds). " + str(e)
+	if isinstance(e, vendorErrors("APIConnectionError")):
+		return "The server could not be reached. " + str(e)
+	if isinstance(e, vendorErrors("RateLimitError")):
+		return "A 429 status code was received (rate limit). " + str(e)
+	if isinstance(e, vendorErrors("APIStatusError")):
+		return "A " + str(e.status_code) + " status code was received. " + str(e)
+	if isinstance(e, CircuitOpenError):
+		return str(e)
+	return type(e).__name__ + ": " + str(e)
+
+def retryAllowed(W, c):
+	"""
+	PURPOSE:	Return True (and account for it) if retry budget of the channel (c: channel key) of the network (W) allows another retry, RETRY_BUDGET retries per minute
+	VERIFIED:	YES
+	"""
+	now = time.monotonic()
+	retries = retry_budget.setdefault((W, c), collections.deque())
+	while (len(retries) > 0) and (retries[0] < now - 60):
+		retries.popleft()
+	if (len(retries) >= RETRY_BUDGET):
+		return False
+	retries.append(now)
+	return True
+
+def getBreaker(api):
+	"""
+	PURPOSE:	Return circuit breaker of the vendor (api)
+	VERIFIED:	YES
+	"""
+	if api not in breakers:
+		breakers[api] = CircuitBreaker(api, BREAKER_FAILURES, BREAKER_COOLDOWN)
+	return breakers[api]
+
+async def aiRequest(CHAN, request, stream=None, deadline=0):
+	"""
+	PURPOSE:	Return result of the request to AI API for the channel (CHAN), retrying transient errors
+							request: function (timeout) returning coroutine with the result of a single attempt
+							All attempts must complete within request_timeout seconds (or before deadline), backoff is exponential with jitter or as requested by retry-after header
+							Streamed request (stream: IrcStream) is not retried once part of the answer was sent to IRC
+							Transient errors are counted by circuit breaker of the vendor, request is not sent while it is open
+	VERIFIED:	YES
+	"""
+	if (deadline == 0):
+		deadline = time.monotonic() + REQUEST_TIMEOUT
+	breaker = getBreaker(CHAN[7])
+	attempt = 0
+	while True:
+		remaining = deadline - time.monotonic()
+		try:
+			if not breaker.allow():
+				raise CircuitOpenError("Circuit breaker of " + CHAN[7] + " is open, request to " + CHAN[5] + " was not sent.")
+			started = time.monotonic()
+			result = await asyncio.wait_for(request(remaining), remaining)
+			metrics.observe("aibot_model_seconds", channelLabels(CHAN), time.monotonic() - started)
+			breaker.success()
+			return result
+		except Exception as e:
+			metrics.inc("aibot_errors_total", channelLabels(CHAN) + (type(e).__name__,))
+			if isinstance(e, CircuitOpenError):
+				raise
+			if isAiErrorRetryable(e) or isinstance(e, asyncio.TimeoutError):
+				breaker.failure()
+			if not isAiErrorRetryable(e):
+				raise
+			if (stream is not None) and (len(stream.answer) > 0):
+				raise
+			delay = aiErrorRetryAfter(e)
+			if (delay < 0):
+				delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+			if (time.monotonic() + delay >= deadline) or not retryAllowed(CHAN[15].name, CHAN[16]):
+				raise
+			attempt += 1
+			printInfo("Retrying request on " + CHAN[0] + " in " + str(round(delay, 1)) + " seconds (" + describeAiError(e) + ")")
+			await asyncio.sleep(delay)
+
+def channelWithModel(CHAN, F):
+	"""
+	PURPOSE:	Return copy of the channel (CHAN) using another model (F: [MODEL, API_KEY, API, AI, PROFILE], e.g. fallback) instead of its own
+							Channel's static profile is kept if F has no PROFILE (e.g. summary model, which uses its own instructions)
+	VERIFIED:	YES
+	"""
+	return CHAN[:5] + F[:3] + [CHAN[8], F[3], CHAN[10], F[4] if (len(F) > 4) else CHAN[11], CHAN[12]] + [[]] + CHAN[14:]
+
+class HedgeRace:
+	"""
+	PURPOSE:	Streamed answer (stream: IrcStream) shared by the models asked at the same time, only the first one producing output writes to it
+	VERIFIED:	YES
+	"""
+	def __init__(self, stream):
+		self.stream = stream
+		self.winner = None
+		self.first = asyncio.Event()
+
+class HedgeLane:
+	"""
+	PURPOSE:	Stream of single model taking part in the race (race: HedgeRace), used instead of IrcStream
+	VERIFIED:	YES
+	"""
+	def __init__(self, race):
+		self.race = race
+
+	@property
+	def answer(self):
+		return self.race.stream.answer if (self.race.winner is self) else []
+
+	async def write(self, text):
+		if self.race.winner is None:
+			self.race.winner = self
+			self.race.first.set()
+		if self.race.winner is self:
+			await self.race.stream.write(text)
+
+	async def close(self):
+		if self.race.winner is self:
+			return await self.race.stream.close()
+		return ""
+
+async def hedgeRequest(CHAN, request, stream=None):
+	"""
+	PURPOSE:	Return the channel (CHAN) or its copy using the fallback model (CHAN[13]) which answered, and result of its request
+							request: function (CHAN, stream) returning function (timeout) for aiRequest
+							Next model of the chain is asked when the previous one failed, or did not produce any output within HEDGE_DELAY seconds (hedging),
+							the first answer is used and the other requests are cancelled
+	VERIFIED:	YES
+	"""
+	targets = [CHAN] + [channelWithModel(CHAN, F) for F in CHAN[13]]
+	if (len(targets) == 1):
+		return CHAN, await aiRequest(CHAN, request(CHAN, stream), stream)
+	deadline = time.monotonic() + REQUEST_TIMEOUT
+	race = HedgeRace(stream) if (stream is not None) else None
+	""" task -> stream of the model, task -> channel with the model """
+	pending = {}
+	asked = {}
+	error = None
+	next_target = 0
+	start = True
+	try:
+		while True:
+			if start and (next_target < len(targets)):
+				T = targets[next_target]
+				if (next_target > 0):
+					printInfo("Asking " + T[5] + " on " + CHAN[0] + " (fallback of " + CHAN[5] + ")")
+				lane = HedgeLane(race) if (race is not None) else None
+				task = asyncio.create_task(aiRequest(T, request(T, lane), lane, deadline))
+				pending[task] = lane
+				asked[task] = T
+				next_target += 1
+			start = False
+			if (len(pending) == 0):
+				raise error
+			waiters = set(pending)
+			first = None
+			if (race is not None) and (race.winner is None):
+				first = asyncio.create_task(race.first.wait())
+				waiters.add(first)
+			hedge = None
+			if (HEDGE_DELAY > 0) and (next_target < len(targets)) and ((race is None) or (race.winner is None)):
+				hedge = HEDGE_DELAY
+			done, _ = await asyncio.wait(waiters, timeout=hedge, return_when=asyncio.FIRST_COMPLETED)
+			if first is not None:
+				first.cancel()
+			if (len(done) == 0):
+				""" no output within HEDGE_DELAY, ask the next model as well """
+				start = True
+				continue
+			if (race is not None) and (race.winner is not None):
+				""" the first output was produced, other models are not needed """
+				for task in list(pending):
+					if (pending[task] is not race.winner):
+						task.cancel()
+						del pending[task]
+			for task in done:
+				if task not in pending:
+					continue
+				lane = pending.pop(task)
+				if task.exception() is None:
+					if (race is None) or (race.winner in (None, lane)):
+						return asked[task], task.result()
+				else:
+					error = task.exception()
+					if (race is not None) and (race.winner is lane):
+						raise error
+					start = True
+	finally:
+		for task in pending:
+			task.cancel()
+
+async def aiChat(ai, api, model, system, messages, max_tokens, timeout):
+	"""
+	PURPOSE:	Return answer (text) of the chat model (model) from vendor (api) using AI client (ai)
+	VERIFIED:	YES
+	"""
+	match (api):
 		case "anthropic":
-			AI = anthropic.Anthropic(api_key=AI_API_KEY)
+			response = await ai.messages.create(
+				model=model,
+				max_tokens=max_tokens,
+				temperature=TEMPERATURE,
+				system=system,
+				messages=messages,
+				timeout=timeout,
+			)
+			return response.content[0].text.strip()
 		case "openai":
-			AI = openai.OpenAI(api_key=AI_API_KEY)
-		case _:
-			printError("Unsupported AI model selected (GLOBAL).\n")
-			exit(1)
-	AI_TYPE = getFromModel("type", AI_MODEL, MODEL)
-	match (AI_TYPE):
-		case "chat" | "image":
-			""" OK """
-		case _:
-			printError("Unsupported AI model type selected (channel: " + c + ").\n")
-			exit(1)
+			response = await ai.chat.completions.create(
+				model=model,
+				max_tokens=max_tokens,
+				temperature=TEMPERATURE,
+				messages=[{ "role": "system", "content": system }] + messages,
+				timeout=timeout,
+			)
+			return response.choices[0].message.content.strip()
+	return ""
+
+async def summarizeHistory(CHAN, who_nick, who_key, QA_old):
+	"""
+	PURPOSE:	Merge Q/A pairs (QA_old) into the running summary for the channel (CHAN) and user (who_nick, who_key: nick key), then remove them from history
+							Uses summary_model if configured, or the channel's model
+	VERIFIED:	YES
+	"""
+	k = (CHAN[15].name, CHAN[16], who_key)
+	try:
+		T = CHAN
+		if SUMMARY_AI is not None:
+			T = channelWithModel(CHAN, [SUMMARY_MODEL, SUMMARY_API_KEY, SUMMARY_API, SUMMARY_AI])
+		system = "You maintain a running summary of a conversation on IRC channel " + CHAN[0] + " between you (the assistant) and the person who's nickname is " + who_nick + "."
+		system += " Merge the previous summary with the new questions/answers into one concise summary (at most " + str(SUMMARY_WORDS) + " words), keep names, facts, decisions and open questions. Reply with the summary only."
+		summary = previous_QA.getSummary(CHAN[15].name, CHAN[16], who_key, CHAN[2])
+		text = "Previous summary: " + (summary if (len(summary) > 0) else "(none)") + "\n\nNew questions/answers:\n"
+		for element in QA_old:
+			text += "Q: " + element.question + "\nA: " + element.answer + "\n"
+		summary = await aiRequest(T, lambda timeout: aiChat(T[9], T[7], T[5], system, [{"role": "user", "content": text}], SUMMARY_MAX_TOKENS, timeout))
+		previous_QA.setSummary(CHAN[15].name, CHAN[16], who_key, QA_old[-1].ts, summary)
+		previous_QA.discard(QA_old)
+		printDebug(DEBUG, "summary (" + CHAN[0] + "/" + who_nick + ") = [" + summary + "]")
+	except Exception as e:
+		printError("Unable to summarize history (" + CHAN[0] + "/" + who_nick + "): " + str(e) + "\n")
+	finally:
+		summarizing.discard(k)
+
+def scheduleSummary(CHAN, who_nick, who_key):
+	"""
+	PURPOSE:	Start summary task in the background if there are at least summary_keep Q/A pairs older than the last summary_keep pairs
+	VERIFIED:	YES
+	"""
+	k = (CHAN[15].name, CHAN[16], who_key)
+	if (k in summarizing):
+		return
+	QA_chan = getChannelHistory(previous_QA, CHAN[15].name, CHAN[16], who_key, CHAN[2], CHAN[3])
+	if (len(QA_chan) < 2 * SUMMARY_KEEP):
+		return
+	summarizing.add(k)
+	task = asyncio.create_task(summarizeHistory(CHAN, who_nick, who_key, QA_chan[:-SUMMARY_KEEP]))
+	tasks.add(task)
+	task.add_done_callback(tasks.discard)
+
+class IrcStream:
+	"""
+	PURPOSE:	Collect answer streamed by AI and send it to IRC channel (on the network: net) line by line, as soon as a complete line (or full IRC line) is available
+							If merge is set, short line is held until the next one, so they can be sent together
+	VERIFIED:	YES
+	"""
+	def __init__(self, net, channel, reply_to, merge=False):
+		self.net = net
+		self.channel = channel
+		self.merge = merge
+		self.buffer = reply_to + ": "
+		self.pending = ""
+		self.answer = []
+
+	async def write(self, text):
+		"""
+		PURPOSE:	Add streamed text, send complete lines
+		"""
+		self.answer.append(text)
+		self.buffer += text
+		end = self.buffer.rfind("\n")
+		if (end >= 0):
+			for line in self.buffer[:end].split("\n"):
+				await self.line(line)
+			self.buffer = self.buffer[end + 1:]
+		budget = ircLineBudget(self.net.my_prefix, self.channel)
+		if (len(self.buffer) > budget // 4) and (len(self.buffer.encode("UTF-8")) > budget):
+			parts = splitIrcText(self.buffer, budget)
+			for line in parts[:-1]:
+				await self.line(line)
+			self.buffer = parts[-1]
 
-	#set GLOBAL variables
-	CONTEXT = getCfgOptionStr(config, "AI", "context", "You are helpful and friendly assistant.")
-	HISTORY_TIME = getCfgOptionInt(config, "AI", "history_time", 0)
-	HISTORY = getCfgOptionInt(config, "AI", "history", 0)
-	USE_NICK = getCfgOptionBoolean(config, "AI", "use_nick", False)
+	async def line(self, line):
+		"""
+		PURPOSE:	Send complete line (or merge it with the pending one)
+		"""
+		line = line.strip()
+		if (len(line) == 0):
+			return
+		if not self.merge:
+			await sendLinesToIrcChannel(self.net, self.channel, line)
+			return
+		if (len(self.pending) > 0) and (len((self.pending + LINE_SEPARATOR + line).encode("UTF-8")) <= ircLineBudget(self.net.my_prefix, self.channel)):
+			self.pending += LINE_SEPARATOR + line
+			return
+		await sendLinesToIrcChannel(self.net, self.channel, self.pending)
+		self.pending = line
 
-	# Set up AI parameters
-	TEMPERATURE = getCfgOptionFloat(config, "AI", "temperature", 0.5)
-	TOP_P = getCfgOptionInt(config, "AI", "top_p", 1)
-	MAX_TOKENS = getCfgOptionInt(config, "AI", "max_tokens", 1000)
-	FREQUENCY_PENALTY = getCfgOptionInt(config, "AI", "frequency_penalty", 0)
-	PRESENCE_PENALTY = getCfgOptionInt(config, "AI", "presence_penalty", 0)
-	REQUEST_TIMEOUT = getCfgOptionInt(config, "AI", "request_timeout", 60)
+	async def close(self):
+		"""
+		PURPOSE:	Send the rest of the answer and return complete answer
+		"""
+		await self.line(self.buffer)
+		await sendLinesToIrcChannel(self.net, self.channel, self.pending)
+		self.buffer = ""
+		self.pending = ""
+		return "".join(self.answer)
 
-	# Set up global IRC settings
-	DEBUG = getCfgOptionBoolean(config, "IRC", "debug", False)
-	ACCEPT_INVITES = getCfgOptionBoolean(config, "IRC", "accept_invites", False)
-	REJOIN_INVITED = getCfgOptionBoolean(config, "IRC", "rejoin_invited", False)
+def setUsage(record, CHAN, tokens_in, tokens_out):
+	"""
+	PURPOSE:	Store the model of the channel (CHAN) and tokens used by the request in the log record, count the tokens in metrics
+	VERIFIED:	YES
+	"""
+	record["model"] = CHAN[5]
+	record["tokens_in"] = tokens_in
+	record["tokens_out"] = tokens_out
+	metrics.inc("aibot_tokens_in_total", channelLabels(CHAN), tokens_in)
+	metrics.inc("aibot_tokens_out_total", channelLabels(CHAN), tokens_out)
 
+def chatRequest(CHAN, who_nick, who_key, question, profile_summary, profile_volatile, answer, record):
 	"""
-	Load servers settings
-		ELEMENT FORMAT: NAME, PORT, TLS, PASSWORD, IDENT, REALNAME, NICKNAME, SASL_MECHANISM, SASL_USERNAME, SASL_PASSWORD
+	PURPOSE:	Return function (timeout) returning coroutine with the answer of the chat model of the channel (CHAN) to the question (from who_nick)
+							If answer (IrcStream) is set, the answer is streamed into it, model and tokens used are stored in the log record
+							Time to build the request and to the first token of the answer are recorded in metrics
+	VERIFIED:	YES
 	"""
-	i = 0
-	SERVER = []
-	while True:
+	profile = CHAN[11] + profile_summary + profile_volatile
+	built = time.perf_counter()
+	match (CHAN[7]):
+		case "anthropic":
+			system, messages = anthropicRequest(CHAN[11], profile_summary, profile_volatile, prepMessages(previous_QA, CHAN[15].name, CHAN[16], who_key, CHAN[2], CHAN[3], question, contextBudget(CHAN, profile)))
+			async def request(timeout):
+				started = time.monotonic()
+				if answer is not None:
+					async with CHAN[9].messages.stream(
+						model=CHAN[5],
+						max_tokens=MAX_TOKENS,
+						temperature=TEMPERATURE,
+						system=system,
+						messages=messages,
+						timeout=timeout,
+					) as response:
+						async for text in response.text_stream:
+							started = observeFirstToken(CHAN, started)
+							await answer.write(text)
+						usage = (await response.get_final_message()).usage
+					setUsage(record, CHAN, usage.input_tokens, usage.output_tokens)
+					return await answer.close()
+				response = await CHAN[9].messages.create(
+					model=CHAN[5],
+					max_tokens=MAX_TOKENS,
+					temperature=TEMPERATURE,
+					system=system,
+					messages=messages,
+					timeout=timeout,
+				)
+				observeFirstToken(CHAN, started)
+				setUsage(record, CHAN, response.usage.input_tokens, response.usage.output_tokens)
+				return response.content[0].text
+		case "openai":
+			messages = openaiRequest(CHAN[11], profile_summary, profile_volatile, prepMessages(previous_QA, CHAN[15].name, CHAN[16], who_key, CHAN[2], CHAN[3], question, contextBudget(CHAN, profile)))
+			async def request(timeout):
+				started = time.monotonic()
+				response = await CHAN[9].chat.completions.create(
+					model=CHAN[5],
+					max_tokens=MAX_TOKENS,
+					temperature=TEMPERATURE,
+					messages=messages,
+					frequency_penalty=FREQUENCY_PENALTY,
+					presence_penalty=PRESENCE_PENALTY,
+					response_format={"type": "text"},
+					stream=(answer is not None),
+					stream_options={"include_usage": True} if (answer is not None) else importVendor("openai").NOT_GIVEN,
+					timeout=timeout
+				)
+				if answer is not None:
+					async for chunk in response:
+						if (len(chunk.choices) > 0) and (chunk.choices[0].delta.content):
+							started = observeFirstToken(CHAN, started)
+							await answer.write(chunk.choices[0].delta.content)
+						if chunk.usage is not None:
+							setUsage(record, CHAN, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+					return await answer.close()
+				observeFirstToken(CHAN, started)
+				if response.usage is not None:
+					setUsage(record, CHAN, response.usage.prompt_tokens, response.usage.completion_tokens)
+				return response.choices[0].message.content
+	metrics.observe("aibot_prompt_build_seconds", channelLabels(CHAN), time.perf_counter() - built)
+	return request
+
+def imageRequest(CHAN, question):
+	"""
+	PURPOSE:	Return function (timeout) returning coroutine with URL of the image generated by the image model of the channel (CHAN)
+	VERIFIED:	YES
+	"""
+	async def request(timeout):
+		response = await CHAN[9].images.generate(
+			model=CHAN[5],
+			prompt=question,
+			n=1,
+			size="1024x1024",
+			timeout=timeout
+		)
+		return response.data[0].url
+	return request
+
+async def answerQuestion(CHAN, who_full, who_nick, who_key, question):
+	"""
+	PURPOSE:	Ask AI the question (from who_nick, who_key: nick key) on the channel (CHAN) and send the answer to IRC, runs as a separate task
+	VERIFIED:	YES
+	"""
+	""" set the Q/A history """
+	leaveInChannelHistory(previous_QA, CHAN[15].name, CHAN[16], who_key, CHAN[2], CHAN[3])
+	""" get assistant's profile (context/instructions): static (precomputed), summary of older Q/A pairs and volatile (date/time, nick) parts """
+	profile_summary = ""
+	if (CHAN[10]):
+		profile_summary = createProfileSummary(who_nick, previous_QA.getSummary(CHAN[15].name, CHAN[16], who_key, CHAN[2]))
+	profile_volatile = createProfileVolatile(CHAN, who_nick)
+	""" display question on console (TIMESTAMP : CHANNEL : WHO_FULL : QUESTION) """
+	ts = int(nowUTC().timestamp())	# 20241206
+	tsh = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')	# 20241206
+	print(str(tsh) + " : " + CHAN[0] + " : " + who_full + " : " + question)	# 20241206
+	record = logRecord(CHAN, who_full, question)
+	start = time.monotonic()
+	""" process the message in accordance with selected AI_MODEL """
+	answers = None
+	match (CHAN[7].lower() + "/" + CHAN[8].lower()):
+		case "anthropic/chat" | "openai/chat":
+			key = answerKey(CHAN, question) if (CHAN[14]) else None
+			answers = answer_cache.get(key) if key is not None else None
+			if answers is not None:
+				printDebug(DEBUG, "answer cache hit (" + CHAN[0] + ") " + answer_cache.stats())
+				await sendMessageToIrcChannel(CHAN[15], CHAN[0], who_nick, answers, CHAN[12])
+				previous_QA.append(QAPair(CHAN[15].name, CHAN[0], CHAN[16], ts, who_nick, who_key, question, answers))
+				record.update(latency=round(time.monotonic() - start, 3), cache=True, answer=answers)
+				writeToLog(record)
+				return answers
+			answer = IrcStream(CHAN[15], CHAN[0], who_nick, CHAN[12]) if (STREAM) else None
+			try:
+				T, answers = await hedgeRequest(CHAN, lambda T, stream: chatRequest(T, who_nick, who_key, question, profile_summary, profile_volatile, stream, record), answer)
+				answers = answers.strip()
+				if not (STREAM):
+					await sendMessageToIrcChannel(CHAN[15], CHAN[0], who_nick, answers, CHAN[12])
+				previous_QA.append(QAPair(CHAN[15].name, CHAN[0], CHAN[16], ts, who_nick, who_key, question, answers))	# 20241206
+				record["answer"] = answers
+				if key is not None:
+					""" answer of the fallback model is cached under its own key (model, profile), so it is not returned as answer of the channel's model """
+					answer_cache.put(answerKey(T, question), answers)
+					printDebug(DEBUG, "answer cache miss (" + CHAN[0] + ") " + answer_cache.stats())
+			except Exception as e:
+				answers = None
+				record["error"] = describeAiError(e)
+				printError(describeAiError(e) + "\n")
+		case "anthropic/image":
+			""" not supported yet """
+		case "openai/image":
+			try:
+				_, long_url = await hedgeRequest(CHAN, lambda T, stream: imageRequest(T, question))
+				import pyshorteners
+				type_tiny = pyshorteners.Shortener()
+				""" URL shortener is blocking, keep it off the event loop """
+				short_url = await asyncio.to_thread(type_tiny.tinyurl.short, long_url)
+				await sendMessageToIrcChannel(CHAN[15], CHAN[0], who_nick, short_url)
+				previous_QA.append(QAPair(CHAN[15].name, CHAN[0], CHAN[16], ts, who_nick, who_key, question, short_url))	# 20241206
+				record["answer"] = short_url
+			except Exception as e:
+				record["error"] = describeAiError(e)
+				printError(describeAiError(e) + "\n")
+		case _:
+			""" this point shall not be reached, it shall be already identified during initialization """
+			printError("Invalid AI model selected.\n")
+	record["latency"] = round(time.monotonic() - start, 3)
+	writeToLog(record)
+	""" compress Q/A pairs falling out of the verbatim window into the running summary """
+	if (CHAN[10]) and (CHAN[8].lower() == "chat"):
+		scheduleSummary(CHAN, who_nick, who_key)
+	return answers
+
+async def askQuestion(CHAN, who_full, who_nick, who_key, question, received):
+	"""
+	PURPOSE:	Answer the question (as answerQuestion) in this process, or by the worker process of the channel in supervisor mode
+							Time since the question was received (received: monotonic) is recorded in metrics
+	VERIFIED:	YES
+	"""
+	metrics.observe("aibot_dispatch_seconds", channelLabels(CHAN), time.monotonic() - received)
+	if supervisor is None:
+		return await answerQuestion(CHAN, who_full, who_nick, who_key, question)
+	return await supervisor.ask(CHAN, who_full, who_nick, who_key, question)
+
+class Supervisor:
+	"""
+	PURPOSE:	Pool of worker processes answering questions (supervisor mode), this process owns IRC connections
+							Channels are sharded between workers by hash of network and channel name, so history of the channel is kept by one worker
+							IPC (stdin/stdout of the worker), one JSON array per line:
+								to worker:	["Q", ID, NETWORK, CHANNEL, PREFIX, WHO_FULL, WHO_NICK, WHO_KEY, QUESTION], ["M", ID] (return metrics)
+								from worker:	["S", NETWORK, LINE, PRIORITY] (send the line to IRC), ["D", ID, ANSWER] (question answered), ["L", RECORD] (write the record to the log file), ["M", ID, SNAPSHOT] (metrics)
+							Worker which exits is restarted, questions it was answering are lost, but IRC connections are not affected
+	VERIFIED:	YES
+	"""
+	def __init__(self, count):
+		self.count = count
+		self.workers = [None] * count
+		""" ID -> [WORKER, future of the answer] """
+		self.pending = {}
+		self.next_id = 0
+		self.tasks = set()
+
+	async def start(self):
+		"""
+		PURPOSE:	Start all worker processes
+		"""
+		for i in range(self.count):
+			await self.spawn(i)
+
+	async def spawn(self, i):
+		"""
+		PURPOSE:	Start worker process (i) and read its messages in the background
+		"""
+		self.workers[i] = await asyncio.create_subprocess_exec(sys.executable, __file__, CONF_FILE, "--worker", str(i), stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, limit=max_ipc_buffer)
+		printInfo("Worker " + str(i) + " started (PID: " + str(self.workers[i].pid) + ")")
+		task = asyncio.create_task(self.read(i, self.workers[i]))
+		self.tasks.add(task)
+		task.add_done_callback(self.tasks.discard)
+
+	def shard(self, net, c):
+		"""
+		PURPOSE:	Return worker of the channel (c: channel key) on the network (net), stable between processes and restarts
+		"""
+		return zlib.crc32((net.name.lower() + " " + c).encode("UTF-8")) % self.count
+
+	async def ask(self, CHAN, who_full, who_nick, who_key, question):
+		"""
+		PURPOSE:	Pass the question to the worker of the channel (CHAN) and return the answer, None if not answered (in time)
+		"""
+		net = CHAN[15]
+		i = self.shard(net, CHAN[16])
+		self.next_id += 1
+		id = self.next_id
+		future = asyncio.get_running_loop().create_future()
+		self.pending[id] = [i, future]
 		try:
-			ist = str(i)
-			s = getCfgOptionStr(config, "IRC", "server[" + ist + "].name", "")
-			p = getCfgOptionInt(config, "IRC", "server[" + ist + "].port", 6667)
-			tls = getCfgOptionBoolean(config, "IRC", "server[" + ist + "].tls", False)
-			pw = getCfgOptionStr(config, "IRC", "server[" + ist + "].password", "")
-			id = getCfgOptionStr(config, "IRC", "server[" + ist + "].ident", "")
-			rn = getCfgOptionStr(config, "IRC", "server[" + ist + "].realname", "")
-			n = getCfgOptionStr(config, "IRC", "server[" + ist + "].nickname", "")[:9]
-			saslm = getCfgOptionStr(config, "IRC", "server[" + ist + "].sasl_mechanism", "")
-			saslu = getCfgOptionStr(config, "IRC", "server[" + ist + "].sasl_username", "")
-			saslp = getCfgOptionStr(config, "IRC", "server[" + ist + "].sasl_password", "")
-			if ((len(s) == 0) | (len(id) == 0) | (len(n) == 0)):
-				break
-			SERVER.append([s, p, tls, pw, id, rn, n, saslm, saslu, saslp])
-			i += 1
-		except:
-			break
-	if (len(SERVER) == 0):
-		printError("Invalid server[" + ist + "] settings.")
-		exit(1)
+			self.workers[i].stdin.write(bytes(json.dumps(["Q", id, net.name, CHAN[0], net.my_prefix, who_full, who_nick, who_key, question], separators=(",", ":")) + "\n", "UTF-8"))
+			await self.workers[i].stdin.drain()
+			return await asyncio.wait_for(future, REQUEST_TIMEOUT + WORKER_TIMEOUT)
+		except asyncio.TimeoutError:
+			printError("Worker " + str(i) + " did not answer within " + str(REQUEST_TIMEOUT + WORKER_TIMEOUT) + " seconds.\n")
+			return None
+		except (ConnectionError, OSError) as e:
+			printError("Unable to pass question to worker " + str(i) + ": " + str(e) + "\n")
+			return None
+		finally:
+			del self.pending[id]
+
+	async def collect(self):
+		"""
+		PURPOSE:	Return snapshots of metrics of the worker processes, workers which do not answer within METRICS_TIMEOUT are skipped
+		"""
+		requests = {}
+		for i in range(self.count):
+			self.next_id += 1
+			future = asyncio.get_running_loop().create_future()
+			self.pending[self.next_id] = [i, future]
+			requests[self.next_id] = future
+			try:
+				self.workers[i].stdin.write(bytes(json.dumps(["M", self.next_id]) + "\n", "UTF-8"))
+				await self.workers[i].stdin.drain()
+			except (ConnectionError, OSError):
+				future.set_result(None)
+		try:
+			done, _ = await asyncio.wait(requests.values(), timeout=METRICS_TIMEOUT)
+		finally:
+			for id in requests:
+				del self.pending[id]
+		return [future.result() for future in done if (future.result() is not None)]
+
+	async def read(self, i, process):
+		"""
+		PURPOSE:	Process messages of the worker (i), restart it when it exits (or sends invalid message)
+							Questions it was answering are answered with None when reading ends for any reason, so they do not wait forever
+		"""
+		try:
+			while True:
+				line = await process.stdout.readline()
+				if not line:
+					break
+				msg = json.loads(line)
+				match (msg[0]):
+					case "S":
+						net = getNetwork(msg[1], NETWORKS)
+						if (net is not None) and (net.irc is not None):
+							net.irc.send(bytes(msg[2], "UTF-8"), msg[3])
+					case "D":
+						element = self.pending.get(msg[1])
+						if (element is not None) and not element[1].done():
+							element[1].set_result(msg[2] if (len(msg[2]) > 0) else None)
+					case "L":
+						writeToLog(msg[1])
+					case "M":
+						element = self.pending.get(msg[1])
+						if (element is not None) and not element[1].done():
+							element[1].set_result(msg[2])
+		except Exception as e:
+			printError("Invalid message from worker " + str(i) + " (" + type(e).__name__ + ": " + str(e) + ")\n")
+			try:
+				process.kill()
+			except ProcessLookupError:
+				""" already exited """
+		finally:
+			for element in self.pending.values():
+				if (element[0] == i) and not element[1].done():
+					element[1].set_result(None)
+		rc = await process.wait()
+		printError("Worker " + str(i) + " exited (" + str(rc) + "). Restarting in " + str(reconnect) + " seconds...")
+		while True:
+			await asyncio.sleep(reconnect)
+			try:
+				await self.spawn(i)
+				return
+			except OSError as e:
+				printError("Unable to start worker " + str(i) + ": " + str(e) + ". Restarting in " + str(reconnect) + " seconds...")
+
+class WorkerSender:
+	"""
+	PURPOSE:	Outbound queue of the network (name) in the worker process, lines are passed to the supervisor which sends them to IRC
+	VERIFIED:	YES
+	"""
+	def __init__(self, name):
+		self.name = name
+
+	def send(self, data, priority=PRIORITY_NORMAL):
+		workerSend(["S", self.name, data.decode("UTF-8"), priority])
+
+def workerSend(msg):
+	"""
+	PURPOSE:	Send message (list) from the worker process to the supervisor
+	VERIFIED:	YES
+	"""
+	ipc.write(bytes(json.dumps(msg, separators=(",", ":")) + "\n", "UTF-8"))
+	ipc.flush()
 
+async def workerAnswer(msg):
 	"""
-	Load channels settings
-		ELEMENT FORMAT: NAME, CONTEXT, HISTORY_TIME, HISTORY, USE_NICK, MODEL, API_KEY, API, AI(var)
+	PURPOSE:	Answer the question passed by the supervisor (msg: ["Q", ID, NETWORK, CHANNEL, PREFIX, WHO_FULL, WHO_NICK, WHO_KEY, QUESTION])
+	VERIFIED:	YES
+	"""
+	answers = None
+	try:
+		net = getNetwork(msg[2], NETWORKS)
+		net.my_prefix = msg[4]
+		answers = await answerQuestion(getChannel(net, msg[3]), msg[5], msg[6], msg[7], msg[8])
+	except Exception as e:
+		printError("Unable to answer question: " + str(e) + "\n")
+	finally:
+		workerSend(["D", msg[1], answers if (answers is not None) else ""])
+
+async def worker():
 	"""
-	i = 0
-	CHANNEL = []
-	CHANNELS = ""
+	PURPOSE:	Worker process (supervisor mode): answer questions passed by the supervisor on stdin and return its metrics, until the supervisor exits
+	VERIFIED:	YES
+	"""
+	for net in NETWORKS:
+		net.irc = WorkerSender(net.name)
+	task = asyncio.create_task(preloadVendors())
+	tasks.add(task)
+	task.add_done_callback(tasks.discard)
+	reader = asyncio.StreamReader(limit=max_ipc_buffer)
+	await asyncio.get_running_loop().connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
 	while True:
-		c = ""
-		try:
-			ist = str(i)
-			c = getCfgOptionStr(config, "IRC", "channel[" + ist + "].name", "")
-			if (len(c) == 0):
-				break
-			cx = getCfgOptionStr(config, "IRC", "channel[" + ist + "].context", CONTEXT)
-			ht = getCfgOptionInt(config, "IRC", "channel[" + ist + "].history_time", HISTORY_TIME)
-			h = getCfgOptionInt(config, "IRC", "channel[" + ist + "].history", HISTORY)
-			u = getCfgOptionBoolean(config, "IRC", "channel[" + ist + "].use_nick", USE_NICK)
-			m = getCfgOptionStr(config, "IRC", "channel[" + ist + "].model", AI_MODEL)
-			ak = getCfgOptionStr(config, "IRC", "channel[" + ist + "].api_key", AI_API_KEY)
-			api = getFromModel("api", m, MODEL)
-			match (api):
-				case "anthropic":
-					try:
-						ai = anthropic.Anthropic(api_key=ak)
-					except:
-						""" add handling """
-				case "openai":
-					try:
-						ai = openai.OpenAI(api_key=ak)
-					except:
-						""" add handling """
-				case _:
-					printError("Unsupported AI model selected (channel: " + c + ").\n")
-					exit(1)
-			t = getFromModel("type", m, MODEL)
-			match (t):
-				case "chat" | "image":
-					""" OK """
-				case _:
-					printError("Unsupported AI model type selected (channel: " + c + ").\n")
-					exit(1)
-			if (getChannelIndex(c, CHANNEL) < 0):
-				CHANNEL.append([c, cx, ht, h, u, m, ak, api, t, ai])
-				CHANNELS += c + ","
-			i += 1
-		except:
-			break
-	CHANNELS = CHANNELS[:-1]
+		line = await reader.readline()
+		if not line:
+			return
+		msg = json.loads(line)
+		if (msg[0] == "Q"):
+			task = asyncio.create_task(workerAnswer(msg))
+			tasks.add(task)
+			task.add_done_callback(tasks.discard)
+		elif (msg[0] == "M"):
+			workerSend(["M", msg[1], metrics.snapshot() + cacheGauges()])
+
+async def answerSharedQuestion(CHAN, who_full, who_nick, who_key, question, key, received):
+	"""
+	PURPOSE:	Answer the question (as answerQuestion) and send the same answer to everybody who asked the same question (key) on the channel (CHAN) in the meantime
+	VERIFIED:	YES
+	"""
+	try:
+		answers = await askQuestion(CHAN, who_full, who_nick, who_key, question, received)
+	finally:
+		followers = inflight.pop(key, [])
+	if (answers is None) or (len(answers) == 0):
+		return
+	for follower in followers:
+		await sendMessageToIrcChannel(CHAN[15], CHAN[0], follower[0], answers, CHAN[12])
+		previous_QA.append(QAPair(CHAN[15].name, CHAN[0], CHAN[16], follower[1], follower[0], follower[4], follower[2], answers))
+		record = logRecord(CHAN, follower[3], follower[2])
+		record.update(coalesced=True, answer=answers)
+		writeToLog(record)
 
-except Exception as e:
-	printError("Missing or invalid configuration option(s)\n" + str(e) + "\n")
-	exit(1)
+def getChannel(net, channel):
+	"""
+	PURPOSE:	Return settings (CHANNEL element) of the channel on the network (net), channel bot was invited to is added using GLOBAL defaults
+	VERIFIED:	YES
+	"""
+	CHAN = net.channel_keys.get(ircLower(channel))
+	if CHAN is None:
+		CHAN = [channel, CONTEXT, HISTORY_TIME, HISTORY, USE_NICK, AI_MODEL, AI_API_KEY, AI_API, AI_TYPE, AI, SUMMARY]
+		CHAN += [createProfile(CHAN), MERGE_LINES, createFallback(FALLBACK if (AI_TYPE == "chat") else "", CHAN, API_KEYS), CACHE, net]
+		net.addChannel(CHAN)
+	return CHAN
+
+def ircOnCannotJoin(net, msg):
+	"""
+	PURPOSE:	471: ERR_CHANNELISFULL (RFC1459), 473: ERR_INVITEONLYCHAN (RFC1459), 474: ERR_BANNEDFROMCHAN (RFC1459), 475: ERR_BADCHANNELKEY (RFC1459)
+	VERIFIED:	YES
+	"""
+	if (len(msg.params) > 1):
+		printError("Unable to join " + msg.params[1] + ": Channel can be full, invite only, bot is banned or needs a key.\n")
+
+def ircOnError(net, msg):
+	"""
+	PURPOSE:	ERROR: the server is closing the connection
+	VERIFIED:	YES
+	"""
+	printError("Received an ERROR from the server. Reconnecting...\n")
+	net.irc.close()
+
+def ircOnInvite(net, msg):
+	"""
+	PURPOSE:	INVITE: join the channel (if accept_invites is set)
+	VERIFIED:	YES
+	"""
+	if (ACCEPT_INVITES) and (len(msg.params) > 1):
+		channel = msg.params[1]
+		printInfo("Invited into channel " + channel + " by " + msg.prefix + ". Joining...\n")
+		net.irc.send(bytes("JOIN " + channel + "\n", "UTF-8"))
+
+def ircOnJoin(net, msg):
+	"""
+	PURPOSE:	JOIN: learn our own prefix (nick!user@host) as seen by other users, it counts against IRC line length
+	VERIFIED:	YES
+	"""
+	if (ircLower(getNickFromFull(msg.prefix)) == net.nick_key):
+		net.my_prefix = msg.prefix
+
+def ircOnKick(net, msg):
+	"""
+	PURPOSE:	KICK: rejoin permanent channel (or the invited one, if rejoin_invited is set) the bot was kicked from
+	VERIFIED:	YES
+	"""
+	if (len(msg.params) > 1) and (ircLower(msg.params[1]) == net.nick_key):
+		channel = msg.params[0]
+		printInfo("Kicked from channel " + channel + " by " + msg.prefix + ".")
+		if (ircLower(channel) in [ircLower(c) for c in net.joins]) or (REJOIN_INVITED):
+			printInfo(" Rejoining" + channel + "...\n")
+			net.irc.send(bytes("JOIN " + channel + "\n", "UTF-8"))
+		else:
+			print("\n")
+
+def ircOnPing(net, msg):
+	"""
+	PURPOSE:	PING: answer with PONG, ahead of other queued lines
+	VERIFIED:	YES
+	"""
+	net.irc.send(bytes("PONG :" + (msg.params[0] if (len(msg.params) > 0) else "") + "\n", "UTF-8"), PRIORITY_PONG)
+
+def ircOnPrivmsg(net, msg):
+	"""
+	PURPOSE:	PRIVMSG addressed to the bot on the channel (#CHANNEL :NICK: QUESTION, checked by ircSkipMessage): start a task answering the question
+							The same question already being answered on the channel waits for its answer, !stats is answered only to owners of the bot
+	VERIFIED:	YES
+	"""
+	who_full = msg.prefix
+	who_nick = getNickFromFull(who_full)
+	""" key of the nick (ircLower once per message), used with the channel key (CHAN[16]) by the scheduler, history and summaries """
+	who_key = ircLower(who_nick)
+	""" pull channel settings (channel bot was invited to is added) """
+	CHAN = getChannel(net, msg.params[0])
+	""" pull out the question (after NICK:) """
+	question = msg.params[1][len(net.nick_key) + 1:].strip()
+	""" statistics for the owner of the bot """
+	if (question.lower() == "!stats"):
+		if isOwner(who_full):
+			task = asyncio.create_task(sendStats(net, who_nick))
+			tasks.add(task)
+			task.add_done_callback(tasks.discard)
+		else:
+			printInfo("Ignoring !stats from " + who_full + " on " + CHAN[0] + " (not an owner).")
+		return
+	metrics.inc("aibot_questions_total", (net.name, CHAN[0]))
+	received = net.last_rx
+	""" the same question is already asked on the channel, wait for its answer """
+	key = answerKey(CHAN, question)
+	if key is not None:
+		key = (net.name.lower(), CHAN[16]) + key
+		if key in inflight:
+			printInfo("Question from " + who_full + " on " + CHAN[0] + " is already being answered: " + question)
+			inflight[key].append([who_nick, int(nowUTC().timestamp()), question, who_full, who_key])
+			return
+		inflight[key] = []
+	""" answer in the background, so other channels and PING are not blocked, within limits of the scheduler """
+	if key is not None:
+		job = lambda: answerSharedQuestion(CHAN, who_full, who_nick, who_key, question, key, received)
+	else:
+		job = lambda: askQuestion(CHAN, who_full, who_nick, who_key, question, received)
+	match (scheduler.submit(net.name, CHAN[16], who_key, job)):
+		case "queued":
+			net.irc.send(bytes("NOTICE " + who_nick + " :I am busy right now, your question on " + CHAN[0] + " is queued.\n", "UTF-8"))
+		case "dropped":
+			inflight.pop(key, None)
+			printInfo("Question from " + who_full + " on " + CHAN[0] + " dropped (queue is full).")
+			net.irc.send(bytes("NOTICE " + who_nick + " :Too many questions, please try again later.\n", "UTF-8"))
 
 """
-MAIN
-"""
-server_id_max = len(SERVER)-1
-server_id = server_id_max
-irc = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-"""
-previous_QA (Q/A history table)
-	ELEMENT FORMAT: CHANNEL, TIMESTAMP, NICKNAME, QUESTION, ANSWER
+IRC_HANDLERS (COMMAND -> function (net, msg: IrcMessage) processing the message), messages with other commands (e.g. NAMES replies, MODE, PONG, QUIT) are skipped without parsing
 """
-previous_QA = []
+IRC_HANDLERS = {
+	"471": ircOnCannotJoin,
+	"473": ircOnCannotJoin,
+	"474": ircOnCannotJoin,
+	"475": ircOnCannotJoin,
+	"ERROR": ircOnError,
+	"INVITE": ircOnInvite,
+	"JOIN": ircOnJoin,
+	"KICK": ircOnKick,
+	"PING": ircOnPing,
+	"PRIVMSG": ircOnPrivmsg,
+}
+
+def processIrcMessage(net, ircmsg):
+	"""
+	PURPOSE:	Process single message received from IRC network (net) by its handler (IRC_HANDLERS), start a task for every question addressed to the bot
+							Messages without a handler and channel messages not addressed to the bot are rejected (ircSkipMessage) before they are parsed
+	VERIFIED:	YES
+	"""
+	if (DEBUG):
+		printDebug(DEBUG, "ircmsg = [" + ircmsg + "]")
+	if ircSkipMessage(net, ircmsg):
+		return
+	msg = parseIrcMessage(ircmsg)
+	if msg is not None:
+		IRC_HANDLERS[msg.command](net, msg)
+
+async def ircReader(net, messages):
+	"""
+	PURPOSE:	Read and process messages from IRC network (net) until the connection is lost
+							All complete messages already buffered (e.g. burst of NAMES replies or PRIVMSGs) are processed in one go
+							Message which fails to be processed is logged and skipped, it does not break the connection
+	VERIFIED:	YES
+	"""
+	try:
+		async for ircmsg in messages:
+			net.last_rx = time.monotonic()
+			ircmsg = ircmsg.strip()
+			if (len(ircmsg) > 0):
+				try:
+					processIrcMessage(net, ircmsg)
+				except Exception as e:
+					printError("Unable to process IRC message (" + type(e).__name__ + ": " + str(e) + "): " + ircmsg + "\n")
+	except (ConnectionError, OSError):
+		return
 
+async def ircKeepAlive(net):
+	"""
+	PURPOSE:	Send PING when connection to IRC network (net) is idle and close it if server does not respond (ping timeout)
+	VERIFIED:	YES
+	"""
+	while True:
+		await asyncio.sleep(ping_interval)
+		idle = time.monotonic() - net.last_rx
+		if (idle >= 2 * ping_interval):
+			printError("Ping timeout (" + str(int(idle)) + " seconds).")
+			net.irc.close()
+			return
+		if (idle >= ping_interval):
+			net.irc.send(bytes("PING :" + net.nickname + "\n", "UTF-8"), PRIORITY_PONG)
 
-# Listen for messages from users and answer questions
-while True:
-	# Check if data is received and connect/re-connect if needed
+async def ircNetwork(net):
+	"""
+	PURPOSE:	Connect/re-connect to IRC network (net) and listen for messages from users and answer questions
+	VERIFIED:	YES
+	"""
 	while True:
-		try:
-			ircmsg = getData(irc).strip()
-			break
-		except UnicodeDecodeError:
+		#connect to the first server which answers, starting from the next one on the list
+		connection = await netConnectAny(net.servers, nextServer(net.server_id, len(net.servers) - 1))
+		nickname = ""
+		if connection is not None:
+			srv, irc_reader, irc = connection
+			net.server_id = net.servers.index(srv)
+			net.srv = srv
+			messages = getMessages(irc_reader)
+			#register with the configured nick, if not possible use a random nick (AIbot####)
+			try:
+				nickname = await asyncio.wait_for(ircRegister(messages, irc, srv[3], srv[4], srv[5], srv[6]), REGISTER_TIMEOUT)
+			except Exception as e:
+				printError("Registration on " + srv[0] + " failed: " + (str(e) or type(e).__name__))
+			if (len(nickname) == 0):
+				irc.close()
+		if (len(nickname) == 0):
+			delay = random.uniform(0, min(RECONNECT_MAX, RECONNECT_MIN * 2 ** min(net.failures, 16)))
+			net.failures += 1
+			metrics.inc("aibot_reconnects_total", (net.name,))
+			printError("Unable to connect to IRC. Reconnecting in " + str(round(delay, 1)) + " seconds...")
+			await asyncio.sleep(delay)
 			continue
-		except:
-			if ('ircmsg' in globals()):
-				printError("Connection to IRC lost (" + srv[0] + "). Reconnecting in " + str(reconnect) + " seconds...")
-			else:
-				printInfo("Starting...")
+		net.failures = 0
+		net.nickname = nickname
+		net.nick_key = ircLower(nickname)
+		saveTlsSession(srv[0], irc)
+		#display connection details
+		ircConnectionDetails(irc, srv[0], srv[1], srv[2], srv[3], srv[4], srv[5], net.nickname, ",".join(net.joins))
+		print("---\n")
+		#until our host is learnt (JOIN), assume the longest one
+		net.my_prefix = net.nickname + "!~" + srv[4] + "@" + HOST_MAX
+		#from now on send everything through the outbound queue (flood control)
+		net.irc = IrcSender(net.name, irc, srv[10], srv[11])
+		net.irc.start()
+		if not (startup_reported):
+			markStartup("connected to IRC (" + srv[0] + ")")
+			reportStartup()
+		#join permanent channels (from config)
+		if (len(net.joins) > 0):
+			ircJoinChannels(net.irc, ",".join(net.joins))
 
-			while True:
-				""" pick up next server """
-				server_id = nextServer(server_id, server_id_max)
-				""" get server's details """
-				srv = SERVER[server_id]
-				#connect with a random nick (AIbot####)
-				connected, irc, nickname = ircConnect(srv[0], srv[1], srv[2], srv[3], srv[4], srv[5], reconnect)
-				if connected:
-					break
-				else:
-					"""print("*** NEXT ***")"""
-
-			#set correct nick (from config) if not possible use previously generated random nick (AIbot####)
-			nickname = ircSetNick(irc, srv[6], nickname)
-			#join permanent channels (from config)
-			ircJoinChannels(irc, CHANNELS)
-			#display connection details
-			ircConnectionDetails(irc, srv[0], srv[1], srv[2], srv[3], srv[4], srv[5], nickname, CHANNELS)
-			print("---\n")
-
-	if (len(ircmsg) > 0):
-		"""
-		Split received data into segments depending on message format
-		FORMAT-1: [command] [:server]
-		FORMAT-2: [:sender|server] [command] [channel] [:MESSAGE]
-					MESSAGE is what user writes to the channel
-							when addressing other users the common format is "USER: text"
-							full FORMAT-2: [:sender] [command] [channel] [:USER:] [text]
-		"""
-		chunk = ircmsg.split()
-		if (chunk[0].startswith(":")):
-			"""
-			Received server or channel message (FORMAT-2)
-			"""
-			printDebug(DEBUG, "ircmsg = [" + ircmsg + "]")
-			command = chunk[1]
-			who_full = chunk[0][1:]
-#			who_nick = who_full.split("!")[0]
-			who_nick = getNickFromFull(who_full)	# 20241216
+		net.last_rx = time.monotonic()
+		keepalive = asyncio.create_task(ircKeepAlive(net))
+		await ircReader(net, messages)
+		keepalive.cancel()
+		net.irc.close()
+		metrics.inc("aibot_reconnects_total", (net.name,))
+		printError("Connection to IRC lost (" + srv[0] + "). Reconnecting...")
+		""" small jitter, so a netsplit does not make all clients of the server reconnect at the same moment """
+		await asyncio.sleep(random.uniform(0, RECONNECT_MIN))
+
+def metricsGauges():
+	"""
+	PURPOSE:	Return current values of gauges (queue depths, uptime) as list of [NAME, LABELS, VALUE]
+	VERIFIED:	YES
+	"""
+	gauges = [
+		["aibot_uptime_seconds", (), round(time.perf_counter() - START_TIME, 3)],
+		["aibot_running_questions", (), scheduler.running],
+		["aibot_queued_questions", (), scheduler.queued],
+		["aibot_inflight_questions", (), len(inflight)],
+	]
+	for net in NETWORKS:
+		if isinstance(net.irc, IrcSender):
+			gauges.append(["aibot_irc_queue_lines", (net.name,), net.irc.pending()])
+	if log is not None:
+		gauges.append(["aibot_log_queue_records", (), len(log.queue)])
+	return gauges
+
+def cacheGauges():
+	"""
+	PURPOSE:	Return gauges of the answer cache of this process as list of [NAME, LABELS, VALUE], they are part of the metrics snapshot (summed over the worker processes)
+	VERIFIED:	YES
+	"""
+	return [
+		["aibot_cache_entries", (), len(answer_cache)],
+		["aibot_cache_bytes", (), answer_cache.bytes],
+		["aibot_cache_hits", (), answer_cache.hits],
+		["aibot_cache_misses", (), answer_cache.misses],
+	]
+
+async def collectMetrics():
+	"""
+	PURPOSE:	Return metrics (Metrics) of this process merged with metrics of the worker processes (supervisor mode)
+	VERIFIED:	YES
+	"""
+	merged = Metrics()
+	merged.merge(metrics.snapshot() + cacheGauges())
+	if supervisor is not None:
+		for snapshot in await supervisor.collect():
+			merged.merge(snapshot)
+	return merged
+
+async def sendStats(net, who_nick):
+	"""
+	PURPOSE:	Send summary of metrics (!stats) to the owner of the bot (who_nick) on the network (net) as NOTICE
+	VERIFIED:	YES
+	"""
+	m = await collectMetrics()
+	model = m.histogram("aibot_model_seconds")
+	first = m.histogram("aibot_first_token_seconds")
+	seconds = lambda h, q: format(h.quantile(q), ".2f") + "s"
+	hits = m.total("aibot_cache_hits")
+	lookups = hits + m.total("aibot_cache_misses")
+	lines = [
+		"Uptime " + str(datetime.timedelta(seconds=int(time.perf_counter() - START_TIME))) + ", questions " + str(m.total("aibot_questions_total")) + " (running " + str(scheduler.running) + ", queued " + str(scheduler.queued) + ", dropped " + str(scheduler.dropped) + "), errors " + str(m.total("aibot_errors_total")) + ", reconnects " + str(m.total("aibot_reconnects_total")) + ", sent " + str(m.total("aibot_sent_bytes_total")) + " bytes",
+		"Tokens in " + str(m.total("aibot_tokens_in_total")) + ", out " + str(m.total("aibot_tokens_out_total")) + "; model p50 " + seconds(model, 0.5) + " p95 " + seconds(model, 0.95) + "; first token p50 " + seconds(first, 0.5) + " p95 " + seconds(first, 0.95) + "; queue p95 " + seconds(m.histogram("aibot_dispatch_seconds"), 0.95) + "; send p95 " + seconds(m.histogram("aibot_send_seconds"), 0.95),
+		"Cache entries " + str(m.total("aibot_cache_entries")) + ", " + str(m.total("aibot_cache_bytes")) + " bytes, hits " + str(hits) + ", misses " + str(lookups - hits) + ", hit ratio " + str(round(100 * hits / lookups, 1) if (lookups > 0) else 0) + "%",
+	]
+	for line in lines:
+		net.irc.send(bytes("NOTICE " + who_nick + " :" + line + "\n", "UTF-8"))
+
+async def metricsHandler(reader, writer):
+	"""
+	PURPOSE:	Answer HTTP request to the metrics endpoint: GET /metrics returns metrics in Prometheus text format, anything else 404
+	VERIFIED:	YES
+	"""
+	try:
+		request = (await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), METRICS_TIMEOUT)).split(b"\r\n", 1)[0].split()
+		if (len(request) >= 2) and (request[0] == b"GET") and (request[1].split(b"?")[0] == b"/metrics"):
+			status = "200 OK"
+			body = (await collectMetrics()).render(metricsGauges())
 		else:
-			"""
-			Received special server message (FORMAT-1, e.g. PING)
-			"""
-			command = chunk[0]
-			who_full = ""
-			who_nick = ""
+			status = "404 Not Found"
+			body = "Not found\n"
+		body = bytes(body, "UTF-8")
+		writer.write(bytes("HTTP/1.1 " + status + "\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: " + str(len(body)) + "\r\nConnection: close\r\n\r\n", "UTF-8") + body)
+		await writer.drain()
+	except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, OSError):
+		""" client gone or invalid request, just close the connection """
+	finally:
+		writer.close()
 
-		channel = ""
+async def preloadVendors():
+	"""
+	PURPOSE:	Import SDKs of AI vendors used by the channels in the background (thread), so the bot connects to IRC without waiting for them and the first question does not wait either
+	VERIFIED:	YES
+	"""
+	global vendors_preloaded
+	for api in sorted(set(client.api for client in list(AI_CLIENTS.values()))):
+		try:
+			await asyncio.to_thread(importVendor, api)
+		except ImportError as e:
+			printError("Unable to import " + api + ": " + str(e) + "\n")
+	vendors_preloaded = True
+	markStartup("AI vendors imported (background)")
+	reportStartup()
 
-		match (command):
-			case "353" | "366":
-				"""
-				353: RPL_NAMREPLY (RFC1459)
-				366: RPL_ENDOFNAMES (RFC1459)
-				"""
-			case "471" | "473" | "474" | "475":
-				"""
-				471: ERR_CHANNELISFULL (RFC1459)
-				473: ERR_INVITEONLYCHAN (RFC1459)
-				474: ERR_BANNEDFROMCHAN (RFC1459)
-				475: ERR_BADCHANNELKEY (RFC1459)
-				"""
-				channel = chunk[3].replace(":", "")
-				printError("Unable to join " + channel + ": Channel can be full, invite only, bot is banned or needs a key.\n")
-			case "ERROR":
-				printError("Received an ERROR from the server. Reconnecting in " + str(reconnect) + " seconds...\n")
-				irc.close()
-				irc = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-			case "INVITE":
-				if (ACCEPT_INVITES):
-					channel = chunk[3].replace(":", "")
-					printInfo("Invited into channel " + channel + " by " + who_full + ". Joining...\n")
-					irc.send(bytes("JOIN " + channel + "\n", "UTF-8"))
-			case "JOIN":
-				""" no actions """
-			case "KICK":
-				if (chunk[3].lower() == nickname.lower()):
-					channel = chunk[2].replace(":", "")
-					printInfo("Kicked from channel " + channel + " by " + who_full + ".")
-					if (channel in "".join(CHANNELS.split()).split(',')) or (REJOIN_INVITED):
-						printInfo(" Rejoining" + channel + "...\n")
-						irc.send(bytes("JOIN " + channel + "\n", "UTF-8"))
-					else:
-						print("\n")
-			case "MODE":
-				""" no actions """
-			case "PING":
-				irc.send(bytes("PONG " + chunk[1] + "\n", "UTF-8"))
-			case "PRIVMSG":
-				"""
-				Processing channel message
-				"""
-				""" get current channel name """
-				channel = chunk[2].replace(":", "")
-				""" to whom message is addressed """
-				to = chunk[3][1:]	# INVESTIGATE correctness of this approach
-				""" """
-				chunk0to3 = chunk[0] + " " + chunk[1] + " " + chunk[2] + " " + chunk[3] + " "
-				""" respond if channel starts with # and if message is addressed to me """
-				if (channel.startswith("#")) and ((to.lower()) == (nickname.lower() + ":")):
-					""" check if channel is present in CHANNEL table """
-					channel_id = getChannelIndex(channel, CHANNEL)
-					""" add channel using GLOBAL defaults for channel bot was invited to """
-					if (channel_id < 0):
-						CHANNEL.append([channel, CONTEXT, HISTORY_TIME, HISTORY, USE_NICK, AI_MODEL, AI_API_KEY, AI_API, AI_TYPE, AI])
-						channel_id = getChannelIndex(channel, CHANNEL)
-					""" pull channel settings """
-					CHAN = CHANNEL[channel_id]
-					""" set the Q/A history """
-					leaveInChannelHistory(previous_QA, CHAN[0], who_nick, CHAN[2], CHAN[3])
-					""" get assistant's complete profile (context/instructions) """
-					profile = createProfile(CHAN, who_nick)
-					""" pull out the question """
-					question = ircmsg[len(chunk0to3):].strip()
-					""" display question on console (TIMESTAMP : CHANNEL : WHO_FULL : QUESTION) """
-					ts = int(nowUTC().timestamp())	# 20241206
-					tsh = datetime.datetime.fromtimestamp(ts, pytz.timezone('UTC')).strftime('%Y-%m-%d %H:%M:%S')	# 20241206
-					print(str(tsh) + " : " + CHAN[0] + " : " + who_full + " : " + question)	# 20241206
-#					writeToLog(str(tsh) + " : " + CHAN[0] + " : " + who_full + " : " + question)	# 20241206
-					writeToLog(str(ts) + " : " + str(tsh) + " : " + CHAN[0] + " : " + who_full + " : " + question)	# 20241216
-					""" process the message in accordance with selected AI_MODEL """
-					match (CHAN[7].lower() + "/" + CHAN[8].lower()):
-						case "anthropic/chat":
-							messages = [] + prepMessages(previous_QA, CHAN[0], who_nick, CHAN[2], CHAN[3], question)
-							try:
-								response = CHAN[9].messages.create(
-									model=CHAN[5],
-									max_tokens=MAX_TOKENS,
-									temperature=TEMPERATURE,
-									system=profile,
-									messages=messages,
-								)
-								answers = response.content[0].text.strip()
-								previous_QA.append([CHAN[0], ts, who_nick, question, answers])	# 20241206
-								sendMessageToIrcChannel(irc, CHAN[0], who_nick, answers)
-							except ai.APIConnectionError as e:
-								printError("The server could not be reached." + str(e) + "\n")
-								print(e.__cause__)
-							except ai.RateLimitError as e:
-								printError("A 429 status code was received; we should back off a bit.\n")
-							except ai.APIStatusError as e:
-								printError("Another non-200-range status code was received.\n")
-								print(e.status_code)
-								print(e.response)
-							except Exception as e:
-								printError(str(e) + "\n")
-						case "anthropic/image":
-							""" not supported yet """
-						case "openai/chat":
-							messages = [{ "role": "system", "content": profile }] + prepMessages(previous_QA, CHAN[0], who_nick, CHAN[2], CHAN[3], question)
-							try:
-								response = CHAN[9].chat.completions.create(
-									model=CHAN[5],
-									max_tokens=MAX_TOKENS,
-									temperature=TEMPERATURE,
-									messages=messages,
-									frequency_penalty=FREQUENCY_PENALTY,
-									presence_penalty=PRESENCE_PENALTY,
-									response_format={"type": "text"}
-								)
-								answers = response.choices[0].message.content.strip()
-								previous_QA.append([CHAN[0], ts, who_nick, question, answers])	# 20241206
-								sendMessageToIrcChannel(irc, CHAN[0], who_nick, answers)
-							except ai.error.Timeout as e:
-								printError(str(e) + "\n")
-							except ai.error.OpenAIError as e:
-								printError(str(e) + "\n")
-							except Exception as e:
-								printError(str(e) + "\n")
-						case "openai/image":
-							try:
-								response = CHAN[9].Image.create(
-									model=CHAN[5],
-									prompt=question,
-									n=1,
-									size="1024x1024"
-								)
-								long_url = response.ircmsg[0].url
-								type_tiny = pyshorteners.Shortener()
-								short_url = type_tiny.tinyurl.short(long_url)
-								previous_QA.append([CHAN[0], ts, who_nick, question, short_url])	# 20241206
-								sendMessageToIrcChannel(irc, CHAN[0], who_nick, short_url)
-							except ai.error.Timeout as e:
-								printError(str(e) + "\n")
-							except ai.error.OpenAIError as e:
-								printError(str(e) + "\n")
-							except Exception as e:
-								printError(str(e) + "\n")
-						case _:
-							""" this point shall not be reached, it shall be already identified during initialization """
-							printError("Invalid AI model selected.\n")
-							continue
-			case "QUIT":
-				print("", end="")
-			case _:
-				print("", end="")
+async def bot():
+	"""
+	PURPOSE:	Connect to all IRC networks at the same time and answer questions
+	VERIFIED:	YES
+	"""
+	global supervisor, vendors_preloaded, metrics_server
+	printInfo("Starting...")
+	if (WORKERS > 0):
+		""" AI requests are sent by the worker processes only """
+		vendors_preloaded = True
+		supervisor = Supervisor(WORKERS)
+		await supervisor.start()
+		markStartup("worker processes started")
 	else:
-		continue
-	time.sleep(1)
+		task = asyncio.create_task(preloadVendors())
+		tasks.add(task)
+		task.add_done_callback(tasks.discard)
+	if (METRICS_PORT > 0):
+		try:
+			metrics_server = await asyncio.start_server(metricsHandler, METRICS_ADDRESS, METRICS_PORT)
+			printInfo("Metrics available at http://" + METRICS_ADDRESS + ":" + str(METRICS_PORT) + "/metrics")
+		except OSError as e:
+			printError("Unable to start metrics endpoint (" + METRICS_ADDRESS + ":" + str(METRICS_PORT) + "): " + str(e) + "\n")
+	if log is not None:
+		log.start()
+	try:
+		await asyncio.gather(*[ircNetwork(net) for net in NETWORKS])
+	finally:
+		if log is not None:
+			await log.close()
+
+def main(argv=None):
+	"""
+	PURPOSE:	Entry point: PROG CONF_FILE [--startup-profile], or PROG CONF_FILE --worker ID (worker process started by the supervisor)
+							Load configuration and run the bot (or the worker process) until it is interrupted
+	VERIFIED:	YES
+	"""
+	global PROG, LOG, CONF_FILE, WORKER, ipc, STARTUP_PROFILE
+	argv = sys.argv if argv is None else argv
+	PROG = argv[0]
+	LOG = PROG + ".jsonl"
+	CONF_FILE = argv[1] if (len(argv) > 1) else ""
+	STARTUP_PROFILE = ("--startup-profile" in argv[2:])
+	if (len(argv) > 3) and (argv[2] == "--worker"):
+		WORKER = int(argv[3])
+		ipc = os.fdopen(os.dup(1), "wb")
+		os.dup2(2, 1)
+	if (WORKER < 0):
+		printBanner()
+	markStartup("Python and standard library, definitions")
+	loadConfig(CONF_FILE)
+	markStartup("configuration")
+	setupState()
+	markStartup("history, caches, log")
+	if (WORKER >= 0):
+		asyncio.run(worker())
+	else:
+		asyncio.run(bot())
+
+if __name__ == "__main__":
+	main()